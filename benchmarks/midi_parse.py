@@ -0,0 +1,69 @@
+#!/usr/bin/env python
+
+"""
+Times parsing a large Standard MIDI File, both into sebastian sequences with
+load_midi and with a handler that does nothing, which measures the parser
+alone.
+
+    python benchmarks/midi_parse.py [notes-per-track] [tracks]
+
+The file is written with sebastian.midi.write_midi first, each track a run
+of notes that don't overlap.
+"""
+
+import os
+import sys
+import tempfile
+import time
+from io import BytesIO
+
+from sebastian.core import OSequence, Point, OFFSET_64, DURATION_64, MIDI_PITCH
+from sebastian.midi import midi, write_midi
+
+
+def make_file(notes, tracks):
+    seqs = []
+    for track in range(tracks):
+        seqs.append(OSequence([
+            Point({OFFSET_64: n * 4, DURATION_64: 3, MIDI_PITCH: 36 + (n + track) % 48})
+            for n in range(notes)
+        ]))
+    out = BytesIO()
+    write_midi.SMF(seqs).write(out)
+    return out.getvalue()
+
+
+def parse_only(filename):
+    midi.SMF(midi.read_file(filename), midi.BaseHandler())
+
+
+def best_of(func, repeat=3):
+    times = []
+    for _ in range(repeat):
+        start = time.time()
+        func()
+        times.append(time.time() - start)
+    return min(times)
+
+
+def main(notes, tracks):
+    data = make_file(notes, tracks)
+    fd, filename = tempfile.mkstemp(suffix=".mid")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        total = notes * tracks
+        parse = best_of(lambda: parse_only(filename))
+        load = best_of(lambda: midi.load_midi(filename))
+    finally:
+        os.remove(filename)
+    print("%d notes in %d bytes" % (total, len(data)))
+    print("parse only  %.3fs  %9.0f notes/s" % (parse, total / parse))
+    print("load_midi   %.3fs  %9.0f notes/s" % (load, total / load))
+
+
+if __name__ == "__main__":
+    main(
+        int(sys.argv[1]) if len(sys.argv) > 1 else 20000,
+        int(sys.argv[2]) if len(sys.argv) > 2 else 8,
+    )
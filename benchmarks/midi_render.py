@@ -0,0 +1,57 @@
+#!/usr/bin/env python
+
+"""
+Measures how many typical pieces a second can be rendered to MIDI bytes in
+memory with SMF.to_bytes, as a render service would serve them.
+
+    python benchmarks/midi_render.py [tracks] [notes-per-track] [seconds]
+
+A typical piece here is a few tracks of a few hundred notes, some of them
+sounding together.
+"""
+
+import sys
+import time
+
+from sebastian.core import OSequence, Point, OFFSET_64, DURATION_64, MIDI_PITCH
+from sebastian.midi.write_midi import SMF
+
+
+def make_piece(tracks, notes):
+    return [
+        OSequence([
+            Point({
+                OFFSET_64: 8 * (n // 2) + 4 * (n % 2),
+                DURATION_64: 8 if n % 3 else 16,
+                MIDI_PITCH: 36 + (7 * n + 5 * track) % 48,
+                "velocity": 60 + n % 40,
+            })
+            for n in range(notes)
+        ])
+        for track in range(tracks)
+    ]
+
+
+def requests_per_second(render, seconds):
+    count = 0
+    start = time.time()
+    while time.time() - start < seconds:
+        render()
+        count += 1
+    return count / (time.time() - start)
+
+
+def main(tracks, notes, seconds):
+    piece = make_piece(tracks, notes)
+    for name, options in [("to_bytes", {}), ("to_bytes compact", {"compact": True})]:
+        size = len(SMF(piece).to_bytes(**options))
+        rate = requests_per_second(lambda: SMF(piece).to_bytes(**options), seconds)
+        print("%-18s %7.1f pieces/s  %6d bytes" % (name, rate, size))
+
+
+if __name__ == "__main__":
+    main(
+        int(sys.argv[1]) if len(sys.argv) > 1 else 4,
+        int(sys.argv[2]) if len(sys.argv) > 2 else 500,
+        float(sys.argv[3]) if len(sys.argv) > 3 else 2.0,
+    )
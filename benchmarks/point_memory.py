@@ -0,0 +1,63 @@
+#!/usr/bin/env python
+
+"""
+Compares the memory taken per note by a Point, a CompactPoint and a
+columnar sequence.
+
+    python benchmarks/point_memory.py [number-of-notes]
+
+Uses tracemalloc where available (Python 3.4+), otherwise sys.getsizeof,
+which only counts the points themselves.
+
+On Python 2 a CompactPoint also carries an instance __dict__ slot, because
+the MutableMapping base class there has no __slots__, so it saves less than
+on Python 3.
+"""
+
+import gc
+import sys
+
+from sebastian.core import Point, CompactPoint, ColumnarOSequence
+from sebastian.core import OFFSET_64, DURATION_64, MIDI_PITCH
+
+try:
+    import tracemalloc
+except ImportError:
+    tracemalloc = None
+
+
+def notes(count):
+    for n in range(count):
+        yield {OFFSET_64: n * 4, DURATION_64: 4, MIDI_PITCH: 36 + n % 48, "velocity": 64}
+
+
+def measure(build, count):
+    gc.collect()
+    if tracemalloc is not None:
+        tracemalloc.start()
+        result = build(count)
+        size = tracemalloc.get_traced_memory()[0]
+        tracemalloc.stop()
+    else:
+        result = build(count)
+        size = 0
+        for point in result:
+            size += sys.getsizeof(point)
+            if getattr(point, "_extra", None):
+                size += sys.getsizeof(point._extra)
+    return float(size) / count
+
+
+def main(count):
+    for name, build in [
+        ("Point", lambda count: [Point(note) for note in notes(count)]),
+        ("CompactPoint", lambda count: [CompactPoint(note) for note in notes(count)]),
+        ("ColumnarOSequence", lambda count: ColumnarOSequence(notes(count))),
+    ]:
+        if tracemalloc is None and name == "ColumnarOSequence":
+            continue
+        print("%-18s %7.1f bytes per note" % (name, measure(build, count)))
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 100000)
@@ -19,10 +19,23 @@ MIDI_PITCH = "midi_pitch"
 DURATION_64 = "duration_64"
 DEGREE = 'degree'
 
-from sebastian.core.elements import OSeq, Point, VSeq, HSeq  # noqa
+# times in MIDI ticks, kept by sebastian.midi.midi.load_midi(ticks=True), and
+# the ticks per quarter note they are in
+TICKS = "ticks"
+DURATION_TICKS = "duration_ticks"
+DIVISION = "division"
+
+from sebastian.core.elements import OSeq, Point, CompactPoint, CompactList, VSeq, HSeq, merge_all, iter_merged  # noqa
+from sebastian.core.storage import ColumnStore  # noqa
 
 OSequence = OSeq(OFFSET_64, DURATION_64)
 
+# an OSequence that keeps its points as columns, for very large scores
+ColumnarOSequence = OSeq(OFFSET_64, DURATION_64, storage=ColumnStore)
+
+# an OSequence that keeps its points as CompactPoints
+CompactOSequence = OSeq(OFFSET_64, DURATION_64, storage=CompactList)
+
 #
 #
 # def shift(offset):
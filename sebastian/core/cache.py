@@ -0,0 +1,165 @@
+"""
+An optional cache of the results of transforming sequences.
+
+When enabled, SeqBase.transform (and so the | operator) looks up the result
+of applying a transform to a sequence by the sequence's points and the
+transform's cache_key, and only runs the transform if it isn't there. Only
+transforms with a cache_key attribute (which all those in
+sebastian.core.transforms have when their arguments are hashable) are
+cached.
+
+A sequence's points are frozen into a ContentKey the first time it is
+transformed, and frozen again after it is appended to or a point is taken
+from it by index. Changes made in place to points got by iterating over a
+sequence aren't noticed, so such a sequence shouldn't be transformed again
+while the cache is enabled.
+
+    from sebastian.core.cache import enable_transform_cache
+    cache = enable_transform_cache(maxsize=1000)
+    ...
+    print(cache.hits, cache.misses)
+"""
+
+try:
+    from collections import OrderedDict
+except ImportError:  # Python 2.6
+    OrderedDict = None
+
+
+class _LinkedDict(object):
+    """
+    the part of OrderedDict that TransformCache uses, for Python 2.6: a dict
+    whose keys are also kept in a circular doubly linked list in the order
+    they were put in
+    """
+
+    def __init__(self):
+        self._links = {}  # key -> [previous link, next link, key, value]
+        self._root = root = []
+        root[:] = [root, root, None, None]
+
+    def __getitem__(self, key):
+        return self._links[key][3]
+
+    def __setitem__(self, key, value):
+        link = self._links.get(key)
+        if link is not None:
+            link[3] = value
+        else:
+            last = self._root[0]
+            link = self._links[key] = [last, self._root, key, value]
+            last[1] = self._root[0] = link
+
+    def pop(self, key):
+        previous, next, key, value = self._links.pop(key)
+        previous[1] = next
+        next[0] = previous
+        return value
+
+    def popitem(self, last=True):
+        if not self._links:
+            raise KeyError("dictionary is empty")
+        key = self._root[0][2] if last else self._root[1][2]
+        return key, self.pop(key)
+
+    def clear(self):
+        self._links.clear()
+        self._root[:] = [self._root, self._root, None, None]
+
+    def __len__(self):
+        return len(self._links)
+
+
+class ContentKey(object):
+    """
+    the points of a sequence, frozen for looking results up by. two keys are
+    equal only if their points are; the hash, worked out once, just narrows
+    the search.
+    """
+
+    __slots__ = ("points", "_hash")
+
+    def __init__(self, points):
+        self.points = tuple(points)
+        self._hash = hash(self.points)
+
+    def __hash__(self):
+        return self._hash
+
+    def __eq__(self, other):
+        if not isinstance(other, ContentKey) or self._hash != other._hash:
+            return False
+        return self.points == other.points
+
+    def __ne__(self, other):
+        return not self == other
+
+
+class TransformCache(object):
+    """
+    a mapping of keys to transform results holding at most maxsize of them,
+    evicting the least recently used first, and counting hits and misses
+    """
+
+    def __init__(self, maxsize=256):
+        self.maxsize = maxsize
+        # key -> result, least recently used first
+        self._results = (OrderedDict or _LinkedDict)()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key):
+        """
+        returns the result stored for key, or None if there isn't one
+        """
+        try:
+            result = self._results.pop(key)
+        except KeyError:
+            self.misses += 1
+            return None
+        # put back as the most recently used
+        self._results[key] = result
+        self.hits += 1
+        return result
+
+    def put(self, key, result):
+        try:
+            self._results.pop(key)
+        except KeyError:
+            pass
+        self._results[key] = result
+        while len(self._results) > self.maxsize:
+            self._results.popitem(last=False)
+            self.evictions += 1
+
+    def clear(self):
+        self._results.clear()
+        self.hits = self.misses = self.evictions = 0
+
+    def __len__(self):
+        return len(self._results)
+
+
+_transform_cache = None
+
+
+def enable_transform_cache(maxsize=256):
+    """
+    starts caching transform results, returning the new TransformCache
+    """
+    global _transform_cache
+    _transform_cache = TransformCache(maxsize)
+    return _transform_cache
+
+
+def disable_transform_cache():
+    global _transform_cache
+    _transform_cache = None
+
+
+def get_transform_cache():
+    """
+    returns the TransformCache in use, or None if caching isn't enabled
+    """
+    return _transform_cache
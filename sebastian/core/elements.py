@@ -1,7 +1,15 @@
 from collections import Iterable
+import heapq
 import tempfile
 import subprocess as sp
 
+try:
+    from collections.abc import MutableMapping
+except ImportError:
+    from collections import MutableMapping
+
+from six.moves import intern
+
 try:
     from IPython.core.display import Image, SVG
     ipython = True
@@ -9,6 +17,10 @@ except ImportError:
     ipython = False
 
 from sebastian.lilypond import write_lilypond
+from sebastian.core import OFFSET_64, DURATION_64, MIDI_PITCH, DEGREE
+from sebastian.core.storage import ColumnStore, Rope, Mapped, freeze
+from sebastian.core.cache import ContentKey, get_transform_cache
+from sebastian.core.timeindex import TimeIndex
 
 
 class UnificationError(Exception):
@@ -33,28 +45,306 @@ class Point(dict):
     __mod__ = unify
 
 
+class WriteBackPoint(Point):
+    """
+    a copy of a point that passes each change made to it on, with _write and
+    _erase, to where the point came from
+    """
+
+    def __setitem__(self, key, value):
+        self._write(key, value)
+        super(WriteBackPoint, self).__setitem__(key, value)
+
+    def __delitem__(self, key):
+        self._erase(key)
+        super(WriteBackPoint, self).__delitem__(key)
+
+    def update(self, *args, **kwargs):
+        for key, value in dict(*args, **kwargs).items():
+            self[key] = value
+
+    def setdefault(self, key, default=None):
+        if key not in self:
+            self[key] = default
+        return self[key]
+
+    def pop(self, key, *default):
+        if key not in self:
+            return super(WriteBackPoint, self).pop(key, *default)
+        value = self[key]
+        del self[key]
+        return value
+
+    def popitem(self):
+        if not self:
+            raise KeyError("popitem(): dictionary is empty")
+        key, value = next(iter(self.items()))
+        del self[key]
+        return key, value
+
+    def clear(self):
+        for key in list(self):
+            del self[key]
+
+
+class ColumnRow(WriteBackPoint):
+    """
+    a point taken by index from a ColumnStore, which writes any change made
+    to it back to its row of the store
+    """
+
+    def __init__(self, store, index, point):
+        super(ColumnRow, self).__init__(point)
+        self._store = store
+        self._index = index
+
+    def _write(self, key, value):
+        self._store.set_value(self._index, key, value)
+
+    def _erase(self, key):
+        self._store.delete_value(self._index, key)
+
+
+class SharedPoint(WriteBackPoint):
+    """
+    a copy of a point that a sequence shares with others in a Rope. the
+    first change made to it has the sequence make its own copies of all its
+    points, and each change is made to the sequence's own copy as well.
+    """
+
+    def __init__(self, seq, index, point):
+        super(SharedPoint, self).__init__(point)
+        self._seq = seq
+        self._index = index
+
+    def _write(self, key, value):
+        self._seq._own_point(self._index)[key] = value
+
+    def _erase(self, key):
+        del self._seq._own_point(self._index)[key]
+
+
+class CompactPoint(MutableMapping):
+    """
+    a Point that takes less memory, for sequences of very many points.
+
+    the core attributes are kept in fixed slots rather than a dict; any
+    others go in a dict made only when needed, with interned keys so every
+    point shares the same key strings. it behaves like a Point (including
+    comparing equal to a Point or dict with the same attributes) apart from
+    not being a dict.
+
+    on Python 2 the MutableMapping base class has no __slots__ of its own,
+    so each CompactPoint still gets a (lazily made) instance __dict__ and
+    saves less memory there than on Python 3.
+    """
+
+    __slots__ = (
+        "_offset_64", "_duration_64", "_midi_pitch", "_degree",
+        "_velocity", "_pitch", "_octave", "_extra",
+    )
+
+    _slots = {
+        OFFSET_64: "_offset_64",
+        DURATION_64: "_duration_64",
+        MIDI_PITCH: "_midi_pitch",
+        DEGREE: "_degree",
+        "velocity": "_velocity",
+        "pitch": "_pitch",
+        "octave": "_octave",
+    }
+
+    def __init__(self, *args, **kwargs):
+        self._extra = None
+        self.update(*args, **kwargs)
+
+    def __getitem__(self, key):
+        slot = self._slots.get(key)
+        if slot is not None:
+            try:
+                return getattr(self, slot)
+            except AttributeError:
+                raise KeyError(key)
+        if self._extra is None:
+            raise KeyError(key)
+        return self._extra[key]
+
+    def __setitem__(self, key, value):
+        slot = self._slots.get(key)
+        if slot is not None:
+            setattr(self, slot, value)
+        else:
+            if self._extra is None:
+                self._extra = {}
+            self._extra[intern(key) if isinstance(key, str) else key] = value
+
+    def __delitem__(self, key):
+        slot = self._slots.get(key)
+        if slot is not None:
+            try:
+                delattr(self, slot)
+            except AttributeError:
+                raise KeyError(key)
+        else:
+            if self._extra is None:
+                raise KeyError(key)
+            del self._extra[key]
+
+    def __iter__(self):
+        for key, slot in self._slots.items():
+            if hasattr(self, slot):
+                yield key
+        if self._extra:
+            for key in self._extra:
+                yield key
+
+    def __len__(self):
+        return sum(1 for key in self)
+
+    def __repr__(self):
+        return "%s(%r)" % (self.__class__.__name__, dict(self))
+
+    def copy(self):
+        return self.__class__(self)
+
+    # needed to pickle a class with __slots__ on Python 2
+    def __getstate__(self):
+        return dict(self)
+
+    def __setstate__(self, state):
+        self._extra = None
+        self.update(state)
+
+    def unify(self, other):
+        new = self.copy()
+        for key, value in other.items():
+            if key in new:
+                if new[key] != value:
+                    raise UnificationError(key)
+            else:
+                new[key] = value
+        return new
+
+    def tuple(self, *attributes):
+        return tuple(self.get(attribute) for attribute in attributes)
+
+    __mod__ = unify
+
+
+class CompactList(list):
+    """
+    a list that stores the points appended to it as CompactPoints, to pass
+    as the storage of a sequence
+    """
+
+    def __init__(self, points=()):
+        super(CompactList, self).__init__(CompactPoint(point) for point in points)
+
+    def append(self, point):
+        super(CompactList, self).append(CompactPoint(point))
+
+
+def _point_key(point):
+    # with each value's type, as 1, 1.0 and True are equal but not the same
+    items = [(key, type(value), value) for key, value in point.items()]
+    try:
+        return frozenset(items)
+    except TypeError:
+        # some values can't be hashed
+        return repr(sorted(items))
+
+
 class SeqBase(object):
 
+    # the list-like type the points are kept in
+    _storage = list
+
     def __init__(self, *elements):
         if len(elements) == 1:
-            if isinstance(elements[0], Point):
+            if isinstance(elements[0], (Point, CompactPoint)):
                 elements = [elements[0]]
             elif isinstance(elements[0], Iterable):
                 elements = list(elements[0])
         else:
             elements = list(elements)
-        self._elements = []
+        self._elements = self._storage()
+        self._content_key = None
 
         for point in elements:
             self.append(point)
 
+    @classmethod
+    def _from_storage(cls, elements):
+        seq = cls()
+        seq._elements = elements
+        return seq
+
+    def _materialize(self):
+        """
+        replaces a lazily joined Rope or lazily Mapped points with this
+        sequence's usual storage, which must be done before its points can
+        be changed. also forgets the content key, as they are about to be.
+        """
+        self._content_key = None
+        if isinstance(self._elements, (Rope, Mapped)):
+            self._elements = self._storage(self._elements)
+
+    def _points_key(self):
+        """
+        returns the points in this sequence frozen into a ContentKey, kept
+        until it is appended to or a point is taken from it by index (and so
+        may be changed). changes to points got by iterating over it aren't
+        noticed.
+        """
+        if self._content_key is None:
+            self._content_key = ContentKey(_point_key(point) for point in self)
+        return self._content_key
+
+    def _points_changed(self):
+        """
+        called when points may be about to be changed in place, to forget
+        what was worked out from them
+        """
+        self._content_key = None
+
+    def _own_point(self, index):
+        """
+        returns the point at index, having replaced lazy storage so that it
+        is one this sequence owns, for a SharedPoint to make its change to
+        """
+        self._materialize()
+        self._points_changed()
+        return self._elements[index]
+
+    def _shared_point(self, point, index):
+        return SharedPoint(self, index, point)
+
+    def fingerprint(self):
+        """
+        returns a hash of the points in this sequence. sequences with
+        different points can have the same fingerprint.
+        """
+        return hash(self._points_key())
+
     def __getitem__(self, item):
+        if isinstance(self._elements, Rope):
+            # copies that take this sequence's points over only if changed
+            if isinstance(item, slice):
+                return [self[index] for index in range(*item.indices(len(self)))]
+            return self._elements.copy_at(item, self._shared_point)
+        # the point returned may be changed in place, so it has to be one
+        # this sequence owns
+        self._materialize()
+        self._points_changed()
         return self._elements[item]
 
     def __len__(self):
         return len(self._elements)
 
     def __iter__(self):
+        if isinstance(self._elements, Rope):
+            # copies of the shared points, which take them over if changed
+            return self._elements.copies(self._shared_point)
         return iter(self._elements)
 
     def __eq__(self, other):
@@ -64,19 +354,79 @@ class SeqBase(object):
         return not (isinstance(other, self.__class__) and self._elements == other._elements)
 
     def map_points(self, func):
-        return self.__class__([func(point=Point(point)) for point in self._elements])
+        """
+        returns a new sequence of copies of the points passed through func.
+
+        the points are copied straight away, so later changes to this
+        sequence don't show through, but func isn't called until the new
+        sequence's points are needed, and consecutive map_points calls are
+        then run together in one pass. so any error func raises comes from
+        whatever first uses the new sequence, not from map_points.
+        """
+        return self._from_storage(Mapped.chain(self._elements, func))
 
     def transform(self, func):
         """
         applies function to a sequence to produce a new sequence
+
+        if the transform cache is enabled (see sebastian.core.cache) and func
+        has a cache_key, a result already worked out for a sequence with the
+        same points is used instead of calling func again.
         """
-        return func(self)
+        cache = get_transform_cache()
+        cache_key = getattr(func, "cache_key", None)
+        if cache is None or cache_key is None:
+            return func(self)
+
+        key = (self.__class__, self._points_key(), cache_key)
+        cached = cache.get(key)
+        if cached is None:
+            result = func(self)
+            if not isinstance(result, SeqBase):
+                return result
+            cached = result.__class__, freeze(result._elements)
+            cache.put(key, cached)
+        seq_class, elements = cached
+        # share the cached points, copying them only if the result is changed
+        return seq_class._from_storage(Rope(None, [(elements, 0)]))
+
+    def zip_with_conflicts(self, other):
+        """
+        zips two sequences unifying the corresponding points like zip, but
+        rather than stopping at the first pair of points that can't be
+        unified, keeps the value from this sequence for each conflict.
+
+        returns the new sequence and a list of (index, attribute) pairs, one
+        for each conflict. columnar sequences are unified a column at a time.
+        """
+        if (isinstance(self._elements, ColumnStore) and isinstance(other, SeqBase) and
+                isinstance(other._elements, ColumnStore)):
+            unified = self._elements.unify(other._elements)
+            if unified is not None:
+                elements, conflicts = unified
+                return self._from_storage(elements), conflicts
+
+        points = []
+        conflicts = []
+        for index, (p1, p2) in enumerate(zip(self, other)):
+            point = Point(p1)
+            for key, value in p2.items():
+                if key not in point:
+                    point[key] = value
+                elif point[key] != value:
+                    conflicts.append((index, key))
+            points.append(point)
+        return self._from_storage(self._storage(points)), conflicts
 
     def zip(self, other):
         """
         zips two sequences unifying the corresponding points.
+        raises UnificationError if any pair of points conflict.
         """
-        return self.__class__(p1 % p2 for p1, p2 in zip(self, other))
+        seq, conflicts = self.zip_with_conflicts(other)
+        if conflicts:
+            raise UnificationError(conflicts[0][1])
+        return seq
 
     __or__ = transform
     __and__ = zip
@@ -140,15 +490,76 @@ class SeqBase(object):
         return f
 
 
-def OSeq(offset_attr, duration_attr):
+def OSeq(offset_attr, duration_attr, storage=list):
+    """
+    makes a sequence class whose points are positioned by offset_attr.
+
+    storage is the list-like type the points are kept in. passing
+    sebastian.core.storage.ColumnStore keeps them as compact columns.
+    """
 
     class _OSeq(SeqBase):
 
+        _storage = storage
+        _offset_attr = offset_attr
+
+        def __init__(self, *elements):
+            # the point with the highest offset (the last appended of any
+            # tied) and whether points were appended in offset order, kept up
+            # to date by append so neither needs a sort. a sequence made from
+            # lazy storage works them out when first needed.
+            self._last = None
+            self._sorted = True
+            self._tracked = True
+            # built the first time a range query needs it
+            self._index = None
+            super(_OSeq, self).__init__(*elements)
+
+        @classmethod
+        def _from_storage(cls, elements):
+            seq = super(_OSeq, cls)._from_storage(elements)
+            seq._tracked = False
+            return seq
+
+        def _materialize(self):
+            super(_OSeq, self)._materialize()
+            # the points are about to change, so the index may no longer fit
+            self._index = None
+
+        def _points_changed(self):
+            super(_OSeq, self)._points_changed()
+            # a point may be given a new offset in place, so the index and
+            # what tracking knew have to be worked out again when next needed
+            self._index = None
+            self._tracked = False
+            self._last = None
+            self._sorted = True
+
+        def _retrack(self):
+            if not self._tracked:
+                self._tracked = True
+                for point in self._elements:
+                    self._track(point)
+
+        def _track(self, point):
+            if self._last is None or point[offset_attr] >= self._last[offset_attr]:
+                self._last = point
+            else:
+                self._sorted = False
+
+        def is_sorted(self):
+            """
+            whether the points are in offset order
+            """
+            self._retrack()
+            return self._sorted
+
         def last_point(self):
-            if len(self._elements) == 0:
+            self._retrack()
+            if self._last is None:
                 return Point({offset_attr: 0, duration_attr: 0})
             else:
-                return sorted(self._elements, key=lambda x: x[offset_attr])[-1]
+                return self._last
 
         def next_offset(self):
             point = self.last_point()
@@ -159,57 +570,132 @@ def OSeq(offset_attr, duration_attr):
             appends a copy of the given point to this sequence, calculating
             the next offset to use for it if it doesn't have one
             """
+            self._materialize()
+            self._retrack()
             point = Point(point)
             if offset_attr not in point:
                 point[offset_attr] = self.next_offset()
             self._elements.append(point)
+            self._track(point)
+            self._index = None
 
-        def concatenate(self, next_seq):
-            """
-            concatenates two sequences to produce a new sequence
-            """
-            offset = self.next_offset()
-
-            new_seq = _OSeq(self._elements)
-            for point in next_seq._elements:
+        def _extend_shifted(self, points, offset):
+            for point in points:
                 new_point = Point(point)
                 new_point[offset_attr] = new_point[offset_attr] + offset
-                new_seq._elements.append(new_point)
+                self._elements.append(new_point)
+                self._track(new_point)
+
+        @classmethod
+        def _join(cls, seqs):
+            """
+            makes a sequence of the given ones one after another in a Rope,
+            copying the points of each sequence once however often it is used
+            """
+            new_seq = cls()
+            rope = Rope(offset_attr)
+            frozen = {}
+            for seq in seqs:
+                if not len(seq):
+                    continue
+                if id(seq) not in frozen:
+                    frozen[id(seq)] = freeze(seq._elements)
+                elements = frozen[id(seq)]
+                offset = new_seq.next_offset()
+                rope.add(elements, offset)
+
+                # work out what tracking each shifted point would have done
+                last = seq.last_point()
+                if offset:
+                    last = Point(last)
+                    last[offset_attr] = last[offset_attr] + offset
+                if new_seq._last is None:
+                    new_seq._sorted = seq.is_sorted()
+                elif new_seq._sorted and seq.is_sorted():
+                    first_offset = next(iter(elements))[offset_attr] + offset
+                    new_seq._sorted = first_offset >= new_seq._last[offset_attr]
+                else:
+                    new_seq._sorted = False
+                if new_seq._last is None or last[offset_attr] >= new_seq._last[offset_attr]:
+                    new_seq._last = last
+            new_seq._elements = rope
             return new_seq
 
+        def concatenate(self, next_seq):
+            """
+            concatenates two sequences to produce a new sequence.
+
+            the new sequence is made lazily, its points shifted only when
+            they are needed. the points got from it by index or by iterating
+            are copies, but changing one first gives the sequence its own
+            copies of all its points and then changes its own copy as well,
+            so the change is kept as in any other sequence.
+            """
+            if not isinstance(next_seq, _OSeq):
+                new_seq = _OSeq(self._elements)
+                new_seq._extend_shifted(next_seq._elements, self.next_offset())
+                return new_seq
+            return _OSeq._join([self, next_seq])
+
         def repeat(self, count):
             """
-            repeat sequence given number of times to produce a new sequence
+            repeat sequence given number of times to produce a new sequence.
+
+            this sequence's points are copied once and shared by every
+            repetition, so the new one costs little more memory however large
+            count is, until one of its points is changed (see concatenate).
             """
-            x = _OSeq()
-            for i in range(count):
-                x = x.concatenate(self)
-            return x
+            return _OSeq._join([self] * count)
+
+        def sorted_points(self):
+            """
+            returns the points in offset order (in their original order where
+            offsets are equal)
+            """
+            if self.is_sorted():
+                return self._elements
+            return self.time_index().points
 
         def merge(self, parallel_seq):
             """
             combine the points in two sequences, putting them in offset order
             """
-            return _OSeq(sorted(self._elements + parallel_seq._elements, key=lambda x: x.get(offset_attr, 0)))
+            return merge_all(self, parallel_seq)
+
+        def time_index(self):
+            """
+            returns the TimeIndex for this sequence, building it if the
+            sequence has changed since it was last built.
+
+            it is rebuilt after a point is appended or taken by index, but
+            changes made in place to points got by iterating aren't noticed.
+            """
+            if self._index is None:
+                self._index = TimeIndex(self._elements, offset_attr, duration_attr)
+            return self._index
 
         def subseq(self, start_offset=0, end_offset=None):
             """
             Return a subset of the sequence
             starting at start_offset (defaulting to the beginning)
             ending at end_offset (None representing the end, whih is the default)
+            The points are in offset order.
             """
-            def subseq_iter(start_offset, end_offset):
-                for point in self._elements:
-                    #Skip until start
-                    if point[offset_attr] < start_offset:
-                        continue
+            return _OSeq(self.time_index().between(start_offset, end_offset))
 
-                    #Yield points start_offset <=  point < end_offset
-                    if end_offset is None or point[offset_attr] < end_offset:
-                        yield point
-                    else:
-                        raise StopIteration
-            return _OSeq(subseq_iter(start_offset, end_offset))
+        def sounding_at(self, offset):
+            """
+            Return the points sounding at the given offset, i.e. starting at
+            or before it and ending after it
+            """
+            return _OSeq(self.time_index().sounding_at(offset))
+
+        def overlapping(self, start_offset, end_offset):
+            """
+            Return the points sounding at any time from start_offset up to
+            end_offset, including those with no duration starting in it
+            """
+            return _OSeq(self.time_index().overlapping(start_offset, end_offset))
 
         __add__ = concatenate
         __mul__ = repeat
@@ -218,6 +704,36 @@ def OSeq(offset_attr, duration_attr):
     return _OSeq
 
 
+def iter_merged(*seqs):
+    """
+    generates the points of the given OSequences in offset order, taking
+    points with equal offsets in the order the sequences are given.
+
+    sequences already in offset order are merged in a single pass without
+    sorting; others are sorted first.
+    """
+    if not seqs:
+        return iter(())
+    offset_attr = seqs[0]._offset_attr
+
+    def keyed(number, seq):
+        for position, point in enumerate(seq.sorted_points()):
+            yield point.get(offset_attr, 0), number, position, point
+
+    merged = heapq.merge(*[keyed(number, seq) for number, seq in enumerate(seqs)])
+    return (point for offset, number, position, point in merged)
+
+
+def merge_all(*seqs):
+    """
+    combine the points in any number of OSequences, putting them in offset
+    order, in a single pass. the result is of the first sequence's type.
+    """
+    if not seqs:
+        raise ValueError("merge_all needs at least one sequence")
+    return seqs[0].__class__(iter_merged(*seqs))
+
+
 class HSeq(SeqBase):
     """
     a horizontal sequence where each element follows the previous
@@ -227,23 +743,28 @@ class HSeq(SeqBase):
         """
         appends a copy of the given point to this sequence
         """
+        self._materialize()
         point = Point(point)
         self._elements.append(point)
 
     def concatenate(self, next_seq):
         """
-        concatenates two sequences to produce a new sequence
+        concatenates two sequences to produce a new sequence.
+
+        the new sequence shares copies of the points of both until one of its
+        points is changed, as OSequence concatenation does.
         """
-        return HSeq(self._elements + next_seq._elements)
+        return HSeq._from_storage(Rope(None, [(freeze(self._elements), 0), (freeze(next_seq._elements), 0)]))
 
     def repeat(self, count):
         """
-        repeat sequence given number of times to produce a new sequence
+        repeat sequence given number of times to produce a new sequence.
+
+        the repetitions share one copy of this sequence's points until one of
+        the new sequence's points is changed.
         """
-        x = HSeq()
-        for i in range(count):
-            x = x.concatenate(self)
-        return x
+        elements = freeze(self._elements)
+        return HSeq._from_storage(Rope(None, [(elements, 0)] * count))
 
     def subseq(self, start_offset=0, end_offset=None):
         """
@@ -285,6 +806,7 @@ class VSeq(SeqBase):
         """
         appends a copy of the given point to this sequence
         """
+        self._materialize()
         point = Point(point)
         self._elements.append(point)
 
@@ -292,6 +814,6 @@ class VSeq(SeqBase):
         """
         combine the points in two sequences
         """
-        return VSeq(self._elements + parallel_seq._elements)
+        return VSeq(list(self) + list(parallel_seq))
 
     __floordiv__ = merge
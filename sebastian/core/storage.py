@@ -0,0 +1,508 @@
+# alternative storage for the elements of a sequence.
+#
+# a sequence normally keeps its points in a plain list. the classes here are
+# list-like stand-ins for that list: they support len(), iteration and
+# indexing (yielding Points) so the sequence operations work on them
+# unchanged.
+
+import weakref
+from array import array
+from bisect import bisect_right
+
+import six
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+
+class ListLike(object):
+    """
+    comparison and repr for the stores below, treating them as the list of
+    points they hold
+    """
+
+    def __eq__(self, other):
+        return list(self) == list(other)
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __repr__(self):
+        return repr(list(self))
+
+
+class ColumnStore(ListLike):
+    """
+    stores points as typed parallel columns rather than as one dict each.
+
+    every attribute with an integer value gets an array column. an attribute
+    that some points don't have also gets a mask recording which rows it is
+    present in. any non-integer value is kept in a sparse dict for its row.
+
+    iteration builds a new Point for each row, so changes made to the points
+    iterated over are not written back to the store. indexing returns a
+    ColumnRow, a Point that writes changes made to it back to its row.
+    """
+
+    typecode = "l"
+    min_value = -2 ** (8 * array(typecode).itemsize - 1)
+    max_value = 2 ** (8 * array(typecode).itemsize - 1) - 1
+
+    def __init__(self, points=()):
+        self._length = 0
+        self._columns = {}
+        self._masks = {}
+        self._extras = {}
+        self._extra_keys = set()
+        for point in points:
+            self.append(point)
+
+    def _add_column(self, key):
+        self._columns[key] = array(self.typecode, [0]) * self._length
+        # a column added part way through is absent from all earlier rows
+        self._masks[key] = bytearray(self._length) if self._length else None
+
+    def _is_column_value(self, value):
+        return type(value) in six.integer_types and self.min_value <= value <= self.max_value
+
+    def append(self, point):
+        values = {}
+        extras = {}
+        for key, value in point.items():
+            if self._is_column_value(value):
+                values[key] = value
+            else:
+                extras[key] = value
+        for key in values:
+            if key not in self._columns:
+                self._add_column(key)
+        for key, column in self._columns.items():
+            mask = self._masks[key]
+            if key in values:
+                column.append(values[key])
+                if mask is not None:
+                    mask.append(1)
+            else:
+                column.append(0)
+                if mask is None:
+                    mask = self._masks[key] = bytearray(b"\x01") * self._length
+                mask.append(0)
+        if extras:
+            self._extras[self._length] = extras
+            self._extra_keys.update(extras)
+        self._length += 1
+
+    def column(self, key):
+        """
+        returns the (values, mask) pair for the given attribute. mask is None
+        if every row has the attribute, otherwise a bytearray with a 1 for
+        each row that has it. returns (None, None) for unknown attributes.
+        """
+        return self._columns.get(key), self._masks.get(key)
+
+    def keys(self):
+        """
+        returns the attributes stored as columns
+        """
+        return list(self._columns)
+
+    def has_extra(self, key):
+        """
+        whether any point has a non-integer value for the given attribute
+        """
+        return key in self._extra_keys
+
+    def with_columns(self, columns, extras=None):
+        """
+        returns a copy of this store with the given columns replaced or added.
+
+        columns maps attributes to (values, mask) pairs like those column()
+        returns, with as many values as there are points. extras maps row
+        numbers to dicts of non-integer values to add to those rows.
+        """
+        new = self.copy()
+        for key, (values, mask) in columns.items():
+            new._columns[key] = array(self.typecode, values)
+            new._masks[key] = None if mask is None else bytearray(mask)
+        for index, values in (extras or {}).items():
+            new._extras.setdefault(index, {}).update(values)
+            new._extra_keys.update(values)
+        return new
+
+    def unify(self, other):
+        """
+        unifies each point in this store with the one at the same position in
+        another store of the same length, a column at a time. where the two
+        disagree the value from this store is kept.
+
+        returns the new store and a sorted list of (index, attribute) pairs
+        for the conflicts. returns None if numpy isn't installed or either
+        store has non-integer values, as those need unifying point by point.
+        """
+        if numpy is None or self._extras or other._extras or len(self) != len(other):
+            return None
+        everywhere = numpy.ones(len(self), dtype=bool)
+        columns = {}
+        conflicts = []
+        for key in set(self._columns) | set(other._columns):
+            values, mask = column_array(self, key)
+            other_values, other_mask = column_array(other, key)
+            if values is None:
+                columns[key] = other.column(key)
+            elif other_values is not None:
+                mask = everywhere if mask is None else mask
+                other_mask = everywhere if other_mask is None else other_mask
+                clashes = mask & other_mask & (values != other_values)
+                conflicts.extend((int(index), key) for index in numpy.flatnonzero(clashes))
+                new_mask = mask | other_mask
+                columns[key] = to_column(
+                    numpy.where(mask, values, other_values),
+                    None if new_mask.all() else new_mask
+                )
+        conflicts.sort()
+        return self.with_columns(columns), conflicts
+
+    def set_value(self, index, key, value):
+        """
+        sets the given attribute of the point in the given row
+        """
+        extras = self._extras.get(index)
+        if self._is_column_value(value):
+            if key not in self._columns:
+                self._add_column(key)
+            self._columns[key][index] = value
+            mask = self._masks[key]
+            if mask is not None:
+                mask[index] = 1
+            if extras and key in extras:
+                del extras[key]
+        else:
+            if key in self._columns:
+                self._clear_column_value(index, key)
+            if extras is None:
+                extras = self._extras[index] = {}
+            extras[key] = value
+            self._extra_keys.add(key)
+
+    def delete_value(self, index, key):
+        """
+        removes the given attribute from the point in the given row
+        """
+        extras = self._extras.get(index)
+        if extras and key in extras:
+            del extras[key]
+        elif not self._clear_column_value(index, key):
+            raise KeyError(key)
+
+    def _clear_column_value(self, index, key):
+        # marks the row as not having the attribute, returning whether it had
+        column = self._columns.get(key)
+        if column is None:
+            return False
+        mask = self._masks[key]
+        if mask is None:
+            mask = self._masks[key] = bytearray(b"\x01") * self._length
+        elif not mask[index]:
+            return False
+        mask[index] = 0
+        column[index] = 0
+        return True
+
+    def _row(self, index):
+        from sebastian.core.elements import ColumnRow
+        return ColumnRow(self, index, self._point(index))
+
+    def _point(self, index):
+        from sebastian.core.elements import Point
+        point = Point()
+        for key, column in self._columns.items():
+            mask = self._masks[key]
+            if mask is None or mask[index]:
+                point[key] = column[index]
+        extras = self._extras.get(index)
+        if extras:
+            point.update(extras)
+        return point
+
+    def __len__(self):
+        return self._length
+
+    def __iter__(self):
+        for index in range(self._length):
+            yield self._point(index)
+
+    def __getitem__(self, item):
+        if isinstance(item, slice):
+            return [self._row(index) for index in range(*item.indices(self._length))]
+        if item < 0:
+            item += self._length
+        if not 0 <= item < self._length:
+            raise IndexError("ColumnStore index out of range")
+        return self._row(item)
+
+    def copy(self):
+        new = self.__class__()
+        new._length = self._length
+        new._columns = dict((key, array(self.typecode, column)) for key, column in self._columns.items())
+        new._masks = dict((key, None if mask is None else bytearray(mask)) for key, mask in self._masks.items())
+        new._extras = dict((index, dict(extras)) for index, extras in self._extras.items())
+        new._extra_keys = set(self._extra_keys)
+        return new
+
+
+def column_array(columns, key):
+    """
+    returns the values of the given attribute in a ColumnStore as a numpy
+    array, and a boolean array of which points have it (or None if all do)
+    """
+    values, mask = columns.column(key)
+    if values is None:
+        return None, None
+    values = numpy.frombuffer(values, dtype=values.typecode)
+    if mask is not None:
+        mask = numpy.frombuffer(mask, dtype=numpy.uint8).astype(bool)
+    return values, mask
+
+
+def to_column(values, mask=None):
+    """
+    converts numpy arrays back to a (values, mask) pair for a ColumnStore
+    """
+    values = values.astype(ColumnStore.typecode).tobytes()
+    if mask is not None:
+        mask = mask.astype(numpy.uint8).tobytes()
+    return values, mask
+
+
+def freeze(elements):
+    """
+    returns an unchanging copy of the given elements that can be shared.
+
+    a list is copied to a tuple of copies of its points, so changes later
+    made to the points in place don't show through. a Rope never changes so
+    is returned as is. the points of a Mapped belong to the sequence it is
+    the storage of, so it is given as another Mapped working out the same
+    points, or as a copy of them if they have been worked out.
+    """
+    if isinstance(elements, Rope):
+        return elements
+    if isinstance(elements, Mapped):
+        return elements.frozen()
+    if isinstance(elements, ColumnStore):
+        return elements.copy()
+    return tuple(point.__class__(point) for point in elements)
+
+
+class Rope(ListLike):
+    """
+    a lazy concatenation of other elements, each shifted by an offset.
+
+    the parts are shared, not copied. shifted copies of their points are made
+    each time the rope is iterated, so a long repetition of the same material
+    costs no more memory than the material itself. a Rope can't be changed
+    once it is in use; a sequence replaces it with its usual storage before
+    changing it.
+
+    a part may itself be a Rope, making a tree. a small rope added to another
+    has its parts taken over, but a larger one is kept as a single part, so
+    that repeating a repetition, or adding to the end of a long rope over and
+    over, costs no more than the parts added.
+
+    if offset_attr is None the parts are simply joined, without shifting.
+    """
+
+    # ropes of at most this many parts have their parts taken over when
+    # added to another, keeping trees shallow
+    max_inline_parts = 32
+
+    def __init__(self, offset_attr, parts=()):
+        self.offset_attr = offset_attr
+        self._parts = []
+        self._ends = []
+        self._length = 0
+        for elements, offset in parts:
+            self.add(elements, offset)
+
+    def add(self, elements, offset=0):
+        """
+        adds elements (which should not change afterwards) to the end of the
+        rope, to have their offsets shifted by offset.
+        """
+        if self._is_branch(elements) and len(elements._parts) <= self.max_inline_parts:
+            for part, part_offset in elements._parts:
+                self._add_part(part, part_offset + offset)
+        elif len(elements):
+            self._add_part(elements, offset)
+
+    def _add_part(self, elements, offset):
+        self._parts.append((elements, offset))
+        self._length += len(elements)
+        self._ends.append(self._length)
+
+    def _is_branch(self, elements):
+        # whether elements is a rope whose parts are walked as part of this
+        # one's, rather than iterated like any other elements
+        return isinstance(elements, Rope) and elements.offset_attr == self.offset_attr
+
+    def _leaves(self):
+        # generates the (elements, offset) of each part that isn't a branch,
+        # in order, walking the tree with a stack rather than recursion as
+        # it can be deep
+        stack = [(iter(self._parts), 0)]
+        while stack:
+            parts, offset = stack[-1]
+            for elements, part_offset in parts:
+                if self._is_branch(elements):
+                    stack.append((iter(elements._parts), offset + part_offset))
+                    break
+                yield elements, offset + part_offset
+            else:
+                stack.pop()
+
+    def _copy(self, point, index, offset, make):
+        point = make(point, index)
+        if offset and self.offset_attr is not None:
+            # set on the dict itself, as make may give a point that passes
+            # changes on
+            dict.__setitem__(point, self.offset_attr, point[self.offset_attr] + offset)
+        return point
+
+    def copies(self, make=None):
+        """
+        generates a shifted copy of each point. make(point, index) makes the
+        copies, which must be dicts; by default they are Points.
+        """
+        if make is None:
+            make = _point_copy
+        copy = self._copy
+        index = 0
+        for elements, offset in self._leaves():
+            for point in elements:
+                yield copy(point, index, offset, make)
+                index += 1
+
+    def copy_at(self, index, make=None):
+        """
+        returns a shifted copy of the point at the given index, made by make
+        as for copies
+        """
+        if make is None:
+            make = _point_copy
+        if index < 0:
+            index += self._length
+        if not 0 <= index < self._length:
+            raise IndexError("Rope index out of range")
+        rope, item, offset = self, index, 0
+        while True:
+            part = bisect_right(rope._ends, item)
+            elements, part_offset = rope._parts[part]
+            item -= rope._ends[part] - len(elements)
+            offset += part_offset
+            if not self._is_branch(elements):
+                return self._copy(elements[item], index, offset, make)
+            rope = elements
+
+    def __len__(self):
+        return self._length
+
+    def __iter__(self):
+        return self.copies()
+
+    def __getitem__(self, item):
+        if isinstance(item, slice):
+            return [self.copy_at(index) for index in range(*item.indices(self._length))]
+        return self.copy_at(item)
+
+
+def _point_copy(point, index):
+    from sebastian.core.elements import Point
+    return Point(point)
+
+
+class Mapped(ListLike):
+    """
+    the points of other elements passed through a chain of functions.
+
+    the points of a list are copied when the Mapped is made, so later changes
+    to them don't show through. nothing else is done until the points are
+    first needed; then every function in the chain is applied to each point
+    in turn, so an error a function raises only surfaces then.
+
+    chaining a function onto a Mapped that hasn't been run yet extends its
+    chain rather than adding another layer, so a run of transforms makes a
+    single pass. the Mappeds of such a chain share the copied points, and
+    the last of them left to run changes them in place, so in the usual
+    case, where only the end of the chain is kept, each point is copied just
+    once. the others copy them again as they run.
+    """
+
+    def __init__(self, elements, funcs, sharers=None):
+        self._source = elements
+        self._funcs = funcs
+        self._points = None
+        # weak references to the Mappeds yet to run that share a source of
+        # points copied for them, or None if the source isn't such a copy
+        self._sharers = sharers
+        if sharers is not None:
+            sharers.append(weakref.ref(self))
+
+    @classmethod
+    def chain(cls, elements, func):
+        """
+        returns a Mapped of the given elements through func
+        """
+        if isinstance(elements, Mapped) and elements._points is None:
+            return cls(elements._source, elements._funcs + [func], elements._sharers)
+        if isinstance(elements, (Rope, ColumnStore, Mapped)):
+            return cls(freeze(elements), [func])
+        from sebastian.core.elements import Point
+        return cls(tuple(Point(point) for point in elements), [func], [])
+
+    def frozen(self):
+        """
+        returns another Mapped of the same points, to be worked out
+        separately, or a tuple of copies of them once they have been
+        """
+        if self._points is None:
+            return self.__class__(self._source, list(self._funcs), self._sharers)
+        return tuple(point.__class__(point) for point in self._points)
+
+    def _last_to_run(self):
+        # whether no other Mapped still to run shares the source, so this
+        # one may change its points in place
+        sharers = self._sharers
+        if sharers is None:
+            return False
+        sharers[:] = [ref for ref in sharers if ref() is not None and ref() is not self]
+        self._sharers = None
+        return not sharers
+
+    def _run(self):
+        if self._points is None:
+            from sebastian.core.elements import Point
+            # these make new points as they are iterated, so needn't be copied
+            fresh = isinstance(self._source, (Rope, ColumnStore)) or self._last_to_run()
+            funcs = self._funcs
+            points = []
+            for point in self._source:
+                if not fresh:
+                    point = Point(point)
+                for func in funcs:
+                    point = func(point=point)
+                points.append(point)
+            self._points = points
+            self._source = self._funcs = None
+        return self._points
+
+    def __len__(self):
+        if self._points is None:
+            return len(self._source)
+        return len(self._points)
+
+    def __iter__(self):
+        return iter(self._run())
+
+    def __getitem__(self, item):
+        return self._run()[item]
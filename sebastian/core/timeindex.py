@@ -0,0 +1,77 @@
+from bisect import bisect_left, bisect_right
+
+
+class TimeIndex(object):
+    """
+    an index of points by time for answering range queries on a sequence.
+
+    the points are kept sorted by offset (in their original order where
+    offsets are equal) alongside a tree holding the latest end of each run of
+    them, so the points sounding at a given time can be found without
+    looking at those that have already finished.
+    """
+
+    def __init__(self, points, offset_attr, duration_attr):
+        self.points = sorted(points, key=lambda point: point[offset_attr])
+        self.offsets = [point[offset_attr] for point in self.points]
+        ends = [offset + point.get(duration_attr, 0) for offset, point in zip(self.offsets, self.points)]
+
+        # a complete binary tree in a list: leaves are the ends of the points
+        # and each node holds the latest end below it
+        size = 1
+        while size < len(ends):
+            size *= 2
+        self._size = size
+        nothing = float("-inf")
+        self._tree = [nothing] * size + ends + [nothing] * (size - len(ends))
+        for node in range(size - 1, 0, -1):
+            self._tree[node] = max(self._tree[2 * node], self._tree[2 * node + 1])
+
+    def _ending_after(self, stop, time):
+        """
+        returns the positions before stop of points ending after time
+        """
+        found = []
+        tree = self._tree
+        # walk the tree left to right, skipping any part ending by time
+        nodes = [(1, 0, self._size)]
+        while nodes:
+            node, start, end = nodes.pop()
+            if start >= stop or tree[node] <= time:
+                continue
+            if node >= self._size:
+                found.append(start)
+            else:
+                middle = (start + end) // 2
+                nodes.append((2 * node + 1, middle, end))
+                nodes.append((2 * node, start, middle))
+        return found
+
+    def between(self, start_offset=0, end_offset=None):
+        """
+        returns the points starting at or after start_offset and before
+        end_offset (None meaning the end)
+        """
+        start = bisect_left(self.offsets, start_offset)
+        if end_offset is None:
+            end = len(self.offsets)
+        else:
+            end = bisect_left(self.offsets, end_offset)
+        return self.points[start:end]
+
+    def sounding_at(self, offset):
+        """
+        returns the points that start at or before offset and end after it
+        """
+        stop = bisect_right(self.offsets, offset)
+        return [self.points[position] for position in self._ending_after(stop, offset)]
+
+    def overlapping(self, start_offset, end_offset):
+        """
+        returns the points that sound at some time from start_offset up to
+        end_offset, including points of no duration starting in that range
+        """
+        start = bisect_left(self.offsets, start_offset)
+        end = bisect_left(self.offsets, end_offset)
+        positions = self._ending_after(start, start_offset) + list(range(start, end))
+        return [self.points[position] for position in positions]
@@ -1,26 +1,90 @@
-from sebastian.core import MIDI_PITCH, OFFSET_64, DURATION_64
+import six
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+from sebastian.core import MIDI_PITCH, OFFSET_64, DURATION_64, TICKS, DURATION_TICKS, DIVISION
 from sebastian.core import Point, OSequence
+from sebastian.core.storage import ColumnStore, column_array, to_column
 
 from sebastian.core.notes import modifiers, letter
 from functools import wraps, partial
 
 
+# columnar sequences with at least this many points are transformed a whole
+# column at a time with numpy, if it is installed
+VECTORIZE_MIN_POINTS = 256
+
+
+def vectorizable(sequence):
+    return (
+        numpy is not None and
+        isinstance(sequence._elements, ColumnStore) and
+        len(sequence) >= VECTORIZE_MIN_POINTS
+    )
+
+
+def with_cache_key(transform, f, args=(), kwargs=None):
+    """
+    gives a transform made by calling f with the given arguments the
+    cache_key that sebastian.core.cache looks its results up by, if the
+    arguments can be hashed
+    """
+    # include types, as equal arguments of different types (like 1 and 1.0)
+    # can give different results
+    key = (
+        f,
+        tuple((type(arg), arg) for arg in args),
+        tuple(sorted((name, type(arg), arg) for name, arg in (kwargs or {}).items())),
+    )
+    try:
+        hash(key)
+    except TypeError:
+        return transform
+    transform.cache_key = key
+    return transform
+
+
 def transform_sequence(f):
     """
     A decorator to take a function operating on a point and
     turn it into a function returning a callable operating on a sequence.
     The functions passed to this decorator must define a kwarg called "point",
     or have point be the last positional argument
+
+    The function is applied lazily with map_points, so an error it raises
+    for some point comes from the first use of the transformed sequence
+    rather than from applying the transform.
+
+    The result's columns attribute is a decorator for registering a numpy
+    version of the transform, used instead on large columnar sequences. It
+    gets the same arguments but with a ColumnStore called "columns" in place
+    of point, and returns a new ColumnStore, or None if it can't handle the
+    store, in which case the point function is used.
     """
     @wraps(f)
     def wrapper(*args, **kwargs):
         #The arguments here are the arguments passed to the transform,
         #ie, there will be no "point" argument
 
-        #Send a function to seq.map_points with all of its arguments applied except
-        #point
-        return lambda seq: seq.map_points(partial(f, *args, **kwargs))
-
+        def _(seq):
+            if wrapper.column_func is not None and vectorizable(seq):
+                columns = wrapper.column_func(*args, columns=seq._elements, **kwargs)
+                if columns is not None:
+                    return seq._from_storage(columns)
+            #Send a function to seq.map_points with all of its arguments applied except
+            #point
+            return seq.map_points(partial(f, *args, **kwargs))
+        return with_cache_key(_, f, args, kwargs)
+
+    def columns(column_func):
+        wrapper.column_func = column_func
+        return column_func
+
+    wrapper.column_func = None
+    wrapper.columns = columns
     return wrapper
 
 
@@ -59,6 +123,16 @@ def transpose(interval, point):
     return point
 
 
+@transpose.columns
+def transpose_columns(interval, columns):
+    if type(interval) not in six.integer_types or columns.has_extra("pitch"):
+        return None
+    pitch, has_pitch = column_array(columns, "pitch")
+    if pitch is None:
+        return columns.copy()
+    return columns.with_columns({"pitch": to_column(pitch + interval, has_pitch)})
+
+
 @transform_sequence
 def stretch(multiplier, point):
     point[OFFSET_64] = int(point[OFFSET_64] * multiplier)
@@ -67,6 +141,63 @@ def stretch(multiplier, point):
     return point
 
 
+@stretch.columns
+def stretch_columns(multiplier, columns):
+    if type(multiplier) not in six.integer_types + (float,):
+        return None
+    if columns.has_extra(OFFSET_64) or columns.has_extra(DURATION_64):
+        return None
+    offset, has_offset = column_array(columns, OFFSET_64)
+    if offset is None or has_offset is not None:
+        return None
+
+    def scaled(values):
+        if type(multiplier) is float:
+            # int() truncates towards zero
+            return numpy.trunc(values * multiplier)
+        return values * multiplier
+
+    new_columns = {OFFSET_64: to_column(scaled(offset))}
+    duration, has_duration = column_array(columns, DURATION_64)
+    if duration is not None:
+        new_columns[DURATION_64] = to_column(scaled(duration), has_duration)
+    return columns.with_columns(new_columns)
+
+
+@transform_sequence
+def rescale(division, point):
+    """
+    Convert a point's ticks and duration_ticks to a new division (ticks per
+    quarter note), rounding down
+    """
+    if DIVISION in point:
+        old_division = point[DIVISION]
+        for key in (TICKS, DURATION_TICKS):
+            if key in point:
+                point[key] = point[key] * division // old_division
+        point[DIVISION] = division
+    return point
+
+
+@rescale.columns
+def rescale_columns(division, columns):
+    if type(division) not in six.integer_types:
+        return None
+    if any(columns.has_extra(key) for key in (TICKS, DURATION_TICKS, DIVISION)):
+        return None
+    old_division, has_division = column_array(columns, DIVISION)
+    if old_division is None:
+        return columns.copy()
+    if has_division is not None:
+        return None
+    new_columns = {DIVISION: to_column(numpy.full_like(old_division, division))}
+    for key in (TICKS, DURATION_TICKS):
+        values, has_values = column_array(columns, key)
+        if values is not None:
+            new_columns[key] = to_column(values * division // old_division, has_values)
+    return columns.with_columns(new_columns)
+
+
 @transform_sequence
 def invert(midi_pitch_pivot, point):
     if MIDI_PITCH in point:
@@ -75,6 +206,16 @@ def invert(midi_pitch_pivot, point):
     return point
 
 
+@invert.columns
+def invert_columns(midi_pitch_pivot, columns):
+    if type(midi_pitch_pivot) not in six.integer_types or columns.has_extra(MIDI_PITCH):
+        return None
+    pitch, has_pitch = column_array(columns, MIDI_PITCH)
+    if pitch is None:
+        return columns.copy()
+    return columns.with_columns({MIDI_PITCH: to_column(midi_pitch_pivot - (pitch - midi_pitch_pivot), has_pitch)})
+
+
 def reverse():
     def _(sequence):
         new_elements = []
@@ -89,7 +230,7 @@ def reverse():
             if new_point != {OFFSET_64: 0}:
                 new_elements.append(new_point)
         return OSequence(sorted(new_elements, key=lambda x: x[OFFSET_64]))
-    return _
+    return with_cache_key(_, reverse, ())
 
 
 def subseq(start_offset=0, end_offset=None):
@@ -98,7 +239,7 @@ def subseq(start_offset=0, end_offset=None):
     """
     def _(sequence):
         return sequence.subseq(start_offset, end_offset)
-    return _
+    return with_cache_key(_, subseq, (start_offset, end_offset))
 
 
 @transform_sequence
@@ -112,6 +253,19 @@ def midi_pitch(point):
     return point
 
 
+@midi_pitch.columns
+def midi_pitch_columns(columns):
+    if any(columns.has_extra(key) for key in ("octave", "pitch", MIDI_PITCH)):
+        return None
+    octave, has_octave = column_array(columns, "octave")
+    pitch, has_pitch = column_array(columns, "pitch")
+    if octave is None or pitch is None or has_octave is not None or has_pitch is not None:
+        return None
+    # modifiers(pitch) is (pitch + 3) // 7
+    new_pitch = numpy.array([2, 9, 4, 11, 5, 0, 7])[pitch % 7] + (pitch + 3) // 7 + 12 * octave
+    return columns.with_columns({MIDI_PITCH: to_column(new_pitch)})
+
+
 @transform_sequence
 def midi_to_pitch(point):  # @@@ add key hint later
     if MIDI_PITCH not in point:
@@ -127,6 +281,33 @@ def midi_to_pitch(point):  # @@@ add key hint later
     return point
 
 
+@midi_to_pitch.columns
+def midi_to_pitch_columns(columns):
+    if any(columns.has_extra(key) for key in ("octave", "pitch", MIDI_PITCH)):
+        return None
+    midi_pitch, has_midi_pitch = column_array(columns, MIDI_PITCH)
+    if midi_pitch is None:
+        return columns.copy()
+    octave, pitch = numpy.divmod(midi_pitch, 12)
+    pitch = numpy.array([-2, 5, 0, -5, 2, -3, 4, -1, 6, 1, -4, 3])[pitch]
+
+    new_columns = {}
+    for key, values in [("octave", octave), ("pitch", pitch)]:
+        if has_midi_pitch is None:
+            new_columns[key] = to_column(values)
+        else:
+            # points without a midi_pitch keep what they had
+            old_values, has_old = column_array(columns, key)
+            if old_values is None:
+                old_values, has_old = numpy.zeros_like(values), numpy.zeros_like(has_midi_pitch)
+            elif has_old is None:
+                has_old = numpy.ones_like(has_midi_pitch)
+            values = numpy.where(has_midi_pitch, values, old_values)
+            has_values = has_midi_pitch | has_old
+            new_columns[key] = to_column(values, None if has_values.all() else has_values)
+    return columns.with_columns(new_columns)
+
+
 @transform_sequence
 def lilypond(point):
     """
@@ -235,23 +416,45 @@ def dynamics(start, end=None):
         else:
             raise ValueError("Unknown end dynamic: %s, must be in %s" % (start, _dynamic_markers_to_velocity.keys()))
 
-        retval = sequence.__class__([Point(point) for point in sequence._elements])
+        if vectorizable(sequence) and not sequence._elements.has_extra("velocity"):
+            return _dynamics_columns(sequence, start_velocity, end_velocity, start_marker, end_marker)
+
+        points = [Point(point) for point in sequence._elements]
 
-        velocity_interval = (float(end_velocity) - float(start_velocity)) / (len(retval) - 1) if len(retval) > 1 else 0
-        velocities = [int(start_velocity + velocity_interval * pos) for pos in range(len(retval))]
+        velocity_interval = (float(end_velocity) - float(start_velocity)) / (len(points) - 1) if len(points) > 1 else 0
+        velocities = [int(start_velocity + velocity_interval * pos) for pos in range(len(points))]
 
         # insert dynamics markers for lilypond
         if start_velocity > end_velocity:
-            retval[0]["dynamic"] = "diminuendo"
-            retval[-1]["dynamic"] = end_marker
+            points[0]["dynamic"] = "diminuendo"
+            points[-1]["dynamic"] = end_marker
         elif start_velocity < end_velocity:
-            retval[0]["dynamic"] = "crescendo"
-            retval[-1]["dynamic"] = end_marker
+            points[0]["dynamic"] = "crescendo"
+            points[-1]["dynamic"] = end_marker
         else:
-            retval[0]["dynamic"] = start_marker
+            points[0]["dynamic"] = start_marker
 
-        for point, velocity in zip(retval, velocities):
+        for point, velocity in zip(points, velocities):
             point["velocity"] = velocity
 
-        return retval
-    return _
+        return sequence.__class__(points)
+    return with_cache_key(_, dynamics, (start, end))
+
+
+def _dynamics_columns(sequence, start_velocity, end_velocity, start_marker, end_marker):
+    """
+    dynamics() for a large columnar sequence, done a column at a time
+    """
+    length = len(sequence)
+    velocity_interval = (float(end_velocity) - float(start_velocity)) / (length - 1) if length > 1 else 0
+    velocities = (start_velocity + velocity_interval * numpy.arange(length)).astype(int)
+
+    if start_velocity > end_velocity:
+        markers = {0: {"dynamic": "diminuendo"}, length - 1: {"dynamic": end_marker}}
+    elif start_velocity < end_velocity:
+        markers = {0: {"dynamic": "crescendo"}, length - 1: {"dynamic": end_marker}}
+    else:
+        markers = {0: {"dynamic": start_marker}}
+
+    columns = sequence._elements.with_columns({"velocity": to_column(velocities)}, markers)
+    return sequence._from_storage(columns)
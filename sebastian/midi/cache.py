@@ -0,0 +1,176 @@
+"""
+An optional on-disk cache of the tracks load_midi parses.
+
+When enabled, load_midi looks a file up by a hash of its contents (and the
+parser version) before parsing it, and stores what it parses. Entries are
+kept in a compact binary form, one file each, and the least recently used
+are removed once the directory holds more than max_bytes of them.
+
+    from sebastian.midi.cache import enable_midi_cache
+    cache = enable_midi_cache("/tmp/midi-cache", max_bytes=100 * 2 ** 20)
+    ...
+    print(cache.hits, cache.misses, cache.bytes_saved)
+"""
+
+import os
+import struct
+import tempfile
+import zlib
+
+from sebastian.core import OSequence, Point, OFFSET_64, MIDI_PITCH, DURATION_64
+
+
+MAGIC = b"SMC1"
+SUFFIX = ".smc"
+NO_TRACK = 0xFFFFFFFF
+
+
+def encode_tracks(tracks, source_size):
+    """
+    returns the tracks (a list of OSequences of points with an offset_64,
+    midi_pitch and duration_64, or None) in the cache's binary form.
+    source_size is the size of the file they were parsed from.
+    """
+    parts = [struct.pack(">QI", source_size, len(tracks))]
+    for track in tracks:
+        if track is None:
+            parts.append(struct.pack(">I", NO_TRACK))
+            continue
+        values = []
+        for point in track:
+            values.extend(point.tuple(OFFSET_64, MIDI_PITCH, DURATION_64))
+        parts.append(struct.pack(">I", len(values) // 3))
+        parts.append(struct.pack("<%di" % len(values), *values))
+    return MAGIC + zlib.compress(b"".join(parts))
+
+
+def decode_tracks(data):
+    """
+    returns the (tracks, source_size) in data from encode_tracks
+    """
+    if data[:4] != MAGIC:
+        raise ValueError("not a MIDI cache entry")
+    data = zlib.decompress(data[4:])
+    source_size, num_tracks = struct.unpack_from(">QI", data)
+    index = 12
+    tracks = []
+    for _ in range(num_tracks):
+        count, = struct.unpack_from(">I", data, index)
+        index += 4
+        if count == NO_TRACK:
+            tracks.append(None)
+            continue
+        values = struct.unpack_from("<%di" % (3 * count), data, index)
+        index += 12 * count
+        tracks.append(OSequence._from_storage([
+            Point({OFFSET_64: values[n], MIDI_PITCH: values[n + 1], DURATION_64: values[n + 2]})
+            for n in range(0, len(values), 3)
+        ]))
+    return tracks, source_size
+
+
+class MidiCache(object):
+    """
+    a directory of parsed MIDI files holding at most about max_bytes of
+    them, evicting the least recently used first, and counting hits, misses
+    and the bytes of MIDI that hits saved parsing
+    """
+
+    def __init__(self, directory, max_bytes=64 * 2 ** 20):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.bytes_saved = 0
+
+    def _path(self, key):
+        return os.path.join(self.directory, key + SUFFIX)
+
+    def get(self, key):
+        """
+        returns the tracks stored for key, or None if there aren't any
+        """
+        path = self._path(key)
+        try:
+            with open(path, "rb") as f:
+                tracks, source_size = decode_tracks(f.read())
+        except (IOError, OSError, ValueError, struct.error, zlib.error):
+            # missing, or unreadable and so as good as missing
+            self.misses += 1
+            return None
+        os.utime(path, None)  # the modification time records the last use
+        self.hits += 1
+        self.bytes_saved += source_size
+        return tracks
+
+    def put(self, key, tracks, source_size):
+        # written under another name first so a reader never sees half of it
+        fd, temp_path = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+        with os.fdopen(fd, "wb") as f:
+            f.write(encode_tracks(tracks, source_size))
+        try:
+            os.rename(temp_path, self._path(key))
+        except OSError:
+            # another process stored it first (on platforms where rename
+            # doesn't replace)
+            os.remove(temp_path)
+        self.evict()
+
+    def evict(self):
+        """
+        removes the least recently used entries until those left take at
+        most max_bytes
+        """
+        entries = []
+        total = 0
+        for name in os.listdir(self.directory):
+            if name.endswith(SUFFIX):
+                stat = os.stat(os.path.join(self.directory, name))
+                entries.append((stat.st_mtime, name, stat.st_size))
+                total += stat.st_size
+        entries.sort()
+        while total > self.max_bytes and entries:
+            mtime, name, size = entries.pop(0)
+            try:
+                os.remove(os.path.join(self.directory, name))
+            except OSError:
+                pass
+            total -= size
+            self.evictions += 1
+
+    def clear(self):
+        for name in os.listdir(self.directory):
+            if name.endswith(SUFFIX):
+                os.remove(os.path.join(self.directory, name))
+        self.hits = self.misses = self.evictions = self.bytes_saved = 0
+
+    def __len__(self):
+        return len([name for name in os.listdir(self.directory) if name.endswith(SUFFIX)])
+
+
+_midi_cache = None
+
+
+def enable_midi_cache(directory, max_bytes=64 * 2 ** 20):
+    """
+    starts caching what load_midi parses in the given directory, returning
+    the new MidiCache
+    """
+    global _midi_cache
+    _midi_cache = MidiCache(directory, max_bytes)
+    return _midi_cache
+
+
+def disable_midi_cache():
+    global _midi_cache
+    _midi_cache = None
+
+
+def get_midi_cache():
+    """
+    returns the MidiCache in use, or None if caching isn't enabled
+    """
+    return _midi_cache
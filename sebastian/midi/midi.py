@@ -6,7 +6,22 @@ A library for parsing Standard MIDI Files (SMFs).
 Currently it just outputs the data it finds.
 """
 
-from sebastian.core import OSequence, Point, OFFSET_64, MIDI_PITCH, DURATION_64
+import hashlib
+import heapq
+import mmap
+import os
+import struct
+from collections import namedtuple
+from multiprocessing import Pool
+from multiprocessing.pool import ThreadPool
+
+import six
+
+from sebastian.core import OSequence, ColumnarOSequence, Point, OFFSET_64, MIDI_PITCH, DURATION_64
+from sebastian.core import TICKS, DURATION_TICKS, DIVISION
+from sebastian.core.storage import ColumnStore
+from sebastian.midi.cache import get_midi_cache
+from sebastian.midi.tempo import TempoMap
 
 
 class Base(object):
@@ -15,17 +30,19 @@ class Base(object):
     instantiated directly, you need to sub-class it and implement a parse()
     method.
 
-    Your sub-class can then be instantiated with a single argument, a byte
-    array.
+    Your sub-class can then be instantiated with a byte array and a handler,
+    and optionally the start and end of the part of the byte array to parse
+    (so a chunk of a file can be parsed in place without copying it out).
 
     Base provides a number of basic methods for pulling data out of the byte
     array and incrementing the index appropriately.
     """
 
-    def __init__(self, data, handler):
+    def __init__(self, data, handler, start=0, end=None):
         self.data = data
         self.handler = handler
-        self.index = 0
+        self.index = start
+        self.end = len(data) if end is None else end
         self.init()
         self.parse()
 
@@ -46,17 +63,13 @@ class Base(object):
         return data
 
     def get_ushort(self):
-        data = 0
-        data += self.get_byte() << 8
-        data += self.get_byte() << 0
+        data, = struct.unpack_from(">H", self.data, self.index)
+        self.index += 2
         return data
 
     def get_ulong(self):
-        data = 0
-        data += self.get_byte() << 24
-        data += self.get_byte() << 16
-        data += self.get_byte() << 8
-        data += self.get_byte() << 0
+        data, = struct.unpack_from(">L", self.data, self.index)
+        self.index += 4
         return data
 
     def get_varlen(self):
@@ -69,6 +82,80 @@ class Base(object):
                 return data
 
 
+def iter_chunks(data, index=0, end=None):
+    """
+    generates (chunk_id, start, end) for each chunk in the SMF in
+    data[index:end], where data[start:end] is the chunk's contents
+    """
+    if end is None:
+        end = len(data)
+    while index < end:
+        chunk_id = bytes(data[index:index + 4])
+        length, = struct.unpack_from(">L", data, index + 4)
+        index += 8
+        yield chunk_id, index, index + length
+        index += length
+
+
+def iter_track_events(data, index=0, end=None):
+    """
+    generates the events in the MTrk chunk contents data[index:end] as
+    (ticks, status, data1, data2) tuples, where ticks is the time in ticks
+    from the start of the track.
+
+    for meta events status is 0xFF, data1 is the type of meta event and
+    data2 its data. for channel events data1 and data2 are the data bytes
+    (data2 is None for events with only one).
+    """
+    if end is None:
+        end = len(data)
+    ticks = 0
+    status = None
+    while index < end:
+        # the variable length time delta, usually a single byte
+        byte = data[index]
+        index += 1
+        if byte & 0x80:
+            time_delta = byte & 0x7F
+            while byte & 0x80:
+                byte = data[index]
+                index += 1
+                time_delta = (time_delta << 7) | (byte & 0x7F)
+            ticks += time_delta
+        else:
+            ticks += byte
+
+        byte = data[index]
+        if byte == 0xFF:
+            meta_type = data[index + 1]
+            index += 2
+            byte = data[index]
+            index += 1
+            length = byte & 0x7F
+            while byte & 0x80:
+                byte = data[index]
+                index += 1
+                length = (length << 7) | (byte & 0x7F)
+            yield ticks, 0xFF, meta_type, data[index:index + length]
+            index += length
+            if meta_type == 0x2F and index < end:
+                raise Exception("more data after track end")
+            continue
+        if byte >= 0x80:
+            status = byte
+            index += 1
+        elif status is None:  # running status, with nothing to run on from
+            raise Exception("unknown status " + hex(byte))
+        if status < 0xC0 or 0xE0 <= status < 0xF0:
+            yield ticks, status, data[index], data[index + 1]
+            index += 2
+        elif status < 0xE0:
+            yield ticks, status, data[index], None
+            index += 1
+        else:
+            raise Exception("unknown status " + hex(status))
+
+
 class SMF(Base):
     """
     A parser for Simple MIDI files.
@@ -81,14 +168,16 @@ class SMF(Base):
         return chunk_id, data
 
     def parse(self):
-        while self.index < len(self.data):
-            chunk_id, data = self.parse_chunk()
+        track_num = 0
+        for chunk_id, start, end in iter_chunks(self.data, self.index, self.end):
             if chunk_id == b"MThd":
-                Thd(data, self.handler)
+                Thd(self.data, self.handler, start, end)
             elif chunk_id == b"MTrk":
-                Trk(data, self.handler)
+                Trk(self.data, self.handler, start, end, track_num)
+                track_num += 1
             else:
                 raise Exception("unknown chunk type")
+        self.index = self.end
 
 
 class Thd(Base):
@@ -97,114 +186,91 @@ class Thd(Base):
     """
 
     def parse(self):
-        format = self.get_ushort()
-        num_tracks = self.get_ushort()
-        division = self.get_ushort()
+        format, num_tracks, division = struct.unpack_from(">HHH", self.data, self.index)
+        self.index += 6
         self.handler.header(format, num_tracks, division)
 
 
 class Trk(Base):
     """
     A parser for the Trk chunk in a MIDI file.
+
+    track_num is the number of the chunk among the MTrk chunks in the file,
+    counting from 0, which is passed on to the handler.
     """
 
+    def __init__(self, data, handler, start=0, end=None, track_num=0):
+        self.track_num = track_num
+        super(Trk, self).__init__(data, handler, start, end)
+
     def init(self):
         self.note_started = {}
 
-    def process_event(self, time_delta, status):
-        if status == 0xFF:
-            status2 = self.get_byte()
-            varlen2 = self.get_varlen()
-            data = self.get_char(varlen2)
-            if status2 == 0x01:
-                self.handler.text_event(data)
-            elif status2 == 0x03:
-                self.handler.track_name(data)
-            elif status2 == 0x04:
-                self.handler.instrument(data)
-            elif status2 == 0x2F:
-                assert varlen2 == 0, varlen2
-                self.track_end = True
-                self.handler.track_end()
-            elif status2 == 0x51:
-                assert varlen2 == 3, varlen2
-                self.handler.tempo(data[0], data[1], data[2])
-            elif status2 == 0x54:
-                assert varlen2 == 5, varlen2
-                self.handler.smpte(data[0], data[1], data[2], data[3], data[4])
-            elif status2 == 0x58:
-                assert varlen2 == 4, varlen2
-                self.handler.time_signature(data[0], data[1], data[2], data[3])
-            elif status2 == 0x59:
-                assert varlen2 == 2, varlen2
-                self.handler.key_signature(data[0], data[1])  # @@@ first arg signed?
-            else:
-                raise Exception("unknown metaevent status " + hex(status2))
-        elif 0x80 <= status <= 0xEF:
-            event_type, channel = divmod(status, 0x10)
-            if event_type == 0x8:  # note off
-                note_number = self.get_byte()
-                velocity = self.get_byte()
-                self.ticks += time_delta
-                if note_number not in self.note_started:
-                    # note was never started so ignore
-                    pass
-                else:
-                    start_ticks, start_velocity = self.note_started.pop(note_number)
-                    duration = self.ticks - start_ticks
-                self.handler.note(start_ticks, channel + 1, note_number, duration)
-            elif event_type == 0x9:  # note on
-                note_number = self.get_byte()
-                velocity = self.get_byte()
-                self.ticks += time_delta
-
-                if velocity > 0:
-                    if note_number in self.note_started:
-                        # new note at that pitch started before previous finished
-                        # not sure it should happen but let's handle it anyway
-                        start_ticks, start_velocity = self.note_started.pop(note_number)
-                        duration = self.ticks - start_ticks
-                        self.handler.note(start_ticks, channel + 1, note_number, duration)
-                    self.note_started[note_number] = self.ticks, velocity
-                else:  # note end
-                    if note_number not in self.note_started:
-                        # note was never started so ignore
-                        pass
-                    else:
-                        start_ticks, start_velocity = self.note_started.pop(note_number)
-                        duration = self.ticks - start_ticks
-                    self.handler.note(start_ticks, channel + 1, note_number, duration)
-
-                self.current_note = (channel + 1, note_number, self.ticks)
-            elif event_type == 0xB:  # controller
-                controller = self.get_byte()
-                value = self.get_byte()
-                self.handler.controller(time_delta, channel + 1, controller, value)
-            elif event_type == 0xC:  # program change
-                program = self.get_byte()
-                self.handler.program_change(time_delta, channel + 1, program)
-            else:
-                raise Exception("unknown event type " + hex(event_type))
+    def meta_event(self, meta_type, data):
+        length = len(data)
+        if meta_type == 0x01:
+            self.handler.text_event(data)
+        elif meta_type == 0x03:
+            self.handler.track_name(data)
+        elif meta_type == 0x04:
+            self.handler.instrument(data)
+        elif meta_type == 0x2F:
+            assert length == 0, length
+            self.track_end = True
+            self.handler.track_end()
+        elif meta_type == 0x51:
+            assert length == 3, length
+            self.handler.tempo(data[0], data[1], data[2])
+            self.handler.tempo_change(self.ticks, (data[0] << 16) | (data[1] << 8) | data[2])
+        elif meta_type == 0x54:
+            assert length == 5, length
+            self.handler.smpte(data[0], data[1], data[2], data[3], data[4])
+        elif meta_type == 0x58:
+            assert length == 4, length
+            self.handler.time_signature(data[0], data[1], data[2], data[3])
+        elif meta_type == 0x59:
+            assert length == 2, length
+            self.handler.key_signature(data[0], data[1])  # @@@ first arg signed?
         else:
-            raise Exception("unknown status " + hex(status))
+            raise Exception("unknown metaevent status " + hex(meta_type))
 
     def parse(self):
         self.ticks = 0
-        self.next_note = 0
-        global track
-        track += 1
-        self.handler.track_start(track)
+        self.handler.track_start(self.track_num)
         self.track_end = False
-        while self.index < len(self.data):
-            if self.track_end:
-                raise Exception("more data after track end")
-            time_delta = self.get_varlen()
-            next_byte = self.peek_byte()
-            if next_byte >= 0x80:
-                status = self.get_byte()
-                self.process_event(time_delta, status)
-            else:  # running status
-                self.process_event(time_delta, status)  # previous status
+        note = self.handler.note
+        note_started = self.note_started
+        # the time of the event before, notes included, as controller and
+        # program_change are passed the time since it
+        previous = 0
+        for ticks, status, data1, data2 in iter_track_events(self.data, self.index, self.end):
+            if status < 0xA0:
+                if status >= 0x90 and data2 > 0:  # note on
+                    if data1 in note_started:
+                        # new note at that pitch started before previous finished
+                        # not sure it should happen but let's handle it anyway
+                        start_ticks, start_velocity = note_started.pop(data1)
+                        note(start_ticks, status - 0x8F, data1, ticks - start_ticks)
+                    note_started[data1] = ticks, data2
+                elif data1 in note_started:  # note off
+                    start_ticks, start_velocity = note_started.pop(data1)
+                    note(start_ticks, status % 0x10 + 1, data1, ticks - start_ticks)
+                # otherwise the note was never started so ignore it
+                previous = ticks
+            else:
+                time_delta = ticks - previous
+                previous = self.ticks = ticks
+                if status == 0xFF:
+                    self.meta_event(data1, data2)
+                    continue
+                event_type, channel = divmod(status, 0x10)
+                if event_type == 0xB:  # controller
+                    self.handler.controller(time_delta, channel + 1, data1, data2)
+                elif event_type == 0xC:  # program change
+                    self.handler.program_change(time_delta, channel + 1, data1)
+                else:
+                    raise Exception("unknown event type " + hex(event_type))
+        self.index = self.end
         if not self.track_end:
             raise Exception("no track end")
 
@@ -232,6 +298,13 @@ class BaseHandler(object):
     def tempo(self, t1, t2, t3):
         pass
 
+    def tempo_change(self, ticks, tempo):
+        """
+        called with the time of each tempo meta event (as well as tempo)
+        and the tempo in microseconds per quarter note
+        """
+        pass
+
     def smpte(self, s1, s2, s3, s4, s5):
         pass
 
@@ -294,33 +367,492 @@ class PrintHandler(BaseHandler):
 
 
 class SebastianHandler(BaseHandler):
+    """
+    a handler building an OSequence of the notes in each track.
+
+    if ticks is True each note also keeps its time and duration in ticks,
+    and the division, without being rounded to 64ths, and the tracks are
+    ColumnarOSequences to hold the extra attributes compactly.
+    """
+
+    def __init__(self, ticks=False):
+        self.ticks = ticks
 
     def header(self, format, num_tracks, division):
         self.division = division
         self.tracks = [None] * num_tracks
+        self.tempo_changes = []
+
+    def tempo_change(self, ticks, tempo):
+        self.tempo_changes.append((ticks, tempo))
+
+    def tempo_map(self):
+        """
+        returns a TempoMap of the tempo changes found in the file
+        """
+        return TempoMap(self.division, self.tempo_changes)
 
     def track_start(self, track_num):
-        self.current_sequence = OSequence()
-        self.tracks[track_num] = self.current_sequence
+        self.current_track = track_num
+        self.current_points = []
+
+    def track_end(self):
+        # the points are new, so the sequence can take them without copying
+        self.tracks[self.current_track] = self.sequence(self.current_points)
+
+    def sequence(self, points):
+        if self.ticks:
+            return ColumnarOSequence._from_storage(ColumnStore(points))
+        return OSequence._from_storage(points)
+
+    def make_point(self, offset, midi_pitch, duration):
+        point = Point({
+            OFFSET_64: 16 * offset // self.division,
+            MIDI_PITCH: midi_pitch,
+            DURATION_64: 16 * duration // self.division,
+        })
+        if self.ticks:
+            point[TICKS] = offset
+            point[DURATION_TICKS] = duration
+            point[DIVISION] = self.division
+        return point
 
     def note(self, offset, channel, midi_pitch, duration):
-        offset_64 = 16 * offset // self.division
-        duration_64 = 16 * duration // self.division
-        point = Point({OFFSET_64: offset_64, MIDI_PITCH: midi_pitch, DURATION_64: duration_64})
-        self.current_sequence.append(point)
+        self.current_points.append(self.make_point(offset, midi_pitch, duration))
 
 
-def load_midi(filename):
-    global track
-    track = -1
-    handler = SebastianHandler()
-    SMF(bytearray(open(filename, "rb").read()), handler)
-    return handler.tracks
+def read_file(filename):
+    """
+    returns the contents of the given file as a bytearray, read directly
+    into it rather than copied
+    """
+    with open(filename, "rb") as f:
+        data = bytearray(os.fstat(f.fileno()).st_size)
+        f.readinto(data)
+    return data
+
+
+# the events iter_events generates. track is the number of the MTrk chunk the
+# event is in (counting from 0), ticks its time from the start of the track
+# and channel a number from 1 to 16. a note on with velocity 0 is a NoteOff.
+NoteOn = namedtuple("NoteOn", "track ticks channel midi_pitch velocity")
+NoteOff = namedtuple("NoteOff", "track ticks channel midi_pitch velocity")
+Controller = namedtuple("Controller", "track ticks channel controller value")
+ProgramChange = namedtuple("ProgramChange", "track ticks channel program")
+MetaEvent = namedtuple("MetaEvent", "track ticks meta_type data")
+# any other channel event (aftertouch, pitch bend)
+ChannelEvent = namedtuple("ChannelEvent", "track ticks status data1 data2")
+
+
+def _iter_file_chunks(f):
+    """
+    generates (chunk_id, data, start, end) for each chunk read from the file
+    object f, reading one chunk at a time
+    """
+    while True:
+        header = f.read(8)
+        if not header:
+            return
+        if len(header) < 8:
+            raise Exception("truncated chunk header")
+        chunk_id = bytes(header[:4])
+        length, = struct.unpack(">L", header[4:])
+        data = bytearray(length)
+        if f.readinto(data) < length:
+            raise Exception("truncated chunk")
+        yield chunk_id, data, 0, length
+
+
+def iter_tracks(source):
+    """
+    generates (data, start, end) for the contents of each MTrk chunk in
+    source, which may be a filename, an open binary file or a bytearray (or
+    bytes, on Python 3) holding a whole SMF.
+
+    a file is read one chunk at a time, so only one track's data is held at
+    once; a buffer is read in place.
+    """
+    if isinstance(source, bytearray) or (six.PY3 and isinstance(source, bytes)):
+        chunks = ((chunk_id, source, start, end) for chunk_id, start, end in iter_chunks(source))
+    elif hasattr(source, "read"):
+        chunks = _iter_file_chunks(source)
+    else:
+        with open(source, "rb") as f:
+            for track in iter_tracks(f):
+                yield track
+        return
+    for chunk_id, data, start, end in chunks:
+        if chunk_id == b"MTrk":
+            yield data, start, end
+        elif chunk_id != b"MThd":
+            raise Exception("unknown chunk type")
+
+
+def iter_track(track, data, start=0, end=None):
+    """
+    generates the events in the MTrk chunk contents data[start:end] as the
+    namedtuples above, giving them the track number track
+    """
+    for ticks, status, data1, data2 in iter_track_events(data, start, end):
+        if status == 0xFF:
+            yield MetaEvent(track, ticks, data1, bytes(data2))
+            continue
+        event_type, channel = divmod(status, 0x10)
+        channel += 1
+        if event_type == 0x9 and data2 > 0:
+            yield NoteOn(track, ticks, channel, data1, data2)
+        elif event_type == 0x8 or event_type == 0x9:
+            yield NoteOff(track, ticks, channel, data1, data2)
+        elif event_type == 0xB:
+            yield Controller(track, ticks, channel, data1, data2)
+        elif event_type == 0xC:
+            yield ProgramChange(track, ticks, channel, data1)
+        else:
+            yield ChannelEvent(track, ticks, status, data1, data2)
+
+
+def iter_events(source, merged=False):
+    """
+    generates the events in an SMF lazily, as NoteOn, NoteOff, Controller,
+    ProgramChange, MetaEvent and ChannelEvent namedtuples. source is as for
+    iter_tracks.
+
+    by default the events come track by track, holding only one track's
+    data at a time. if merged is True they come in time order across all
+    tracks (events at the same time in track order), which needs the data
+    of every track at once, but still makes each event only as it is
+    needed.
+    """
+    if not merged:
+        for track, (data, start, end) in enumerate(iter_tracks(source)):
+            for event in iter_track(track, data, start, end):
+                yield event
+        return
+
+    def keyed(track, data, start, end):
+        for position, event in enumerate(iter_track(track, data, start, end)):
+            yield event.ticks, track, position, event
+
+    tracks = [keyed(track, *chunk) for track, chunk in enumerate(iter_tracks(source))]
+    for ticks, track, position, event in heapq.merge(*tracks):
+        yield event
+
+
+class _NoteTupleHandler(SebastianHandler):
+    """
+    a SebastianHandler keeping each note as an (offset, midi_pitch,
+    duration) tuple in ticks, which is far cheaper to pickle than a Point
+    """
+
+    def track_end(self):
+        pass
+
+    def note(self, offset, channel, midi_pitch, duration):
+        self.current_points.append((offset, midi_pitch, duration))
+
+
+def _load_track(job):
+    """
+    decodes one MTrk chunk of a file for load_midi in a worker process
+    """
+    filename, start, end, division = job
+    with open(filename, "rb") as f:
+        mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            data = bytearray(mapped[start:end])
+        finally:
+            mapped.close()
+    handler = _NoteTupleHandler()
+    handler.header(0, 1, division)
+    Trk(data, handler)
+    return handler.current_points
+
+
+def _load_midi_processes(filename, processes, ticks):
+    handler = SebastianHandler(ticks)
+    jobs = []
+    with open(filename, "rb") as f:
+        mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            for chunk_id, start, end in iter_chunks(mapped):
+                if chunk_id == b"MThd":
+                    Thd(mapped, handler, start, end)
+                elif chunk_id == b"MTrk":
+                    jobs.append((filename, start, end, handler.division))
+                else:
+                    raise Exception("unknown chunk type")
+        finally:
+            mapped.close()
+    pool = Pool(processes)
+    try:
+        results = pool.map(_load_track, jobs)
+    finally:
+        pool.close()
+        pool.join()
+    return [
+        handler.sequence([handler.make_point(*note) for note in notes])
+        for notes in results
+    ]
+
+
+# bump when a change to the parser changes what load_midi returns, so that
+# tracks cached by an earlier version aren't used
+PARSER_VERSION = 1
+
+
+def cache_key(data):
+    """
+    returns the key load_midi caches the tracks parsed from data under
+    """
+    key = hashlib.sha1(("sebastian.midi %d\n" % PARSER_VERSION).encode("ascii"))
+    key.update(data)
+    return key.hexdigest()
+
+
+class MidiTracks(list):
+    """
+    the list of tracks load_midi returns, with the TempoMap of the whole
+    file as tempo_map. that is the one made while parsing the file where
+    the file was parsed in full, and is otherwise read from the file the
+    first time it is used.
+    """
+
+    def __init__(self, tracks, filename, tempo_map=None):
+        super(MidiTracks, self).__init__(tracks)
+        self.filename = filename
+        self._tempo_map = tempo_map
+
+    @property
+    def tempo_map(self):
+        if self._tempo_map is None:
+            self._tempo_map = MidiFile(self.filename).tempo_map()
+        return self._tempo_map
+
+
+def load_midi(filename, processes=None, tracks=None, ticks=False):
+    """
+    returns the tracks in the given SMF as a MidiTracks list of OSequences,
+    whose tempo_map converts the offsets of their points to seconds.
+
+    if ticks is True the points also keep their exact times in ticks (see
+    SebastianHandler); the cache isn't used then.
+
+    if tracks is given only the tracks with those numbers are decoded and
+    returned, in the order given, using a MidiFile; the other options don't
+    apply then.
+
+    if processes is given the tracks are decoded in parallel by a pool of
+    that many processes, each mapping the file into memory and decoding the
+    tracks it is given; this is worth it for files with many large tracks.
+
+    if a MidiCache is enabled (see sebastian.midi.cache) the tracks are
+    taken from it when the file has been parsed before.
+    """
+    if tracks is not None:
+        midi_file = MidiFile(filename, ticks)
+        return MidiTracks([midi_file[track_num] for track_num in tracks], filename)
+    data = None
+    cache = None if ticks else get_midi_cache()
+    if cache is not None:
+        data = read_file(filename)
+        key = cache_key(data)
+        tracks = cache.get(key)
+        if tracks is not None:
+            return MidiTracks(tracks, filename)
+    if processes is not None:
+        tracks = MidiTracks(_load_midi_processes(filename, processes, ticks), filename)
+    else:
+        handler = SebastianHandler(ticks)
+        SMF(read_file(filename) if data is None else data, handler)
+        tracks = MidiTracks(handler.tracks, filename, handler.tempo_map())
+    if cache is not None:
+        cache.put(key, tracks, len(data))
+    return tracks
+
+
+def load_many(filenames, workers=None):
+    """
+    loads each of the given files with load_midi in a pool of workers
+    threads (by default one per CPU), returning a list of their tracks in
+    the same order as the filenames
+    """
+    pool = ThreadPool(workers)
+    try:
+        return pool.map(load_midi, filenames)
+    finally:
+        pool.close()
+        pool.join()
+
+
+def iter_chunk_headers(f):
+    """
+    generates (chunk_id, start, length) for each chunk in the seekable file
+    object f, where start is the position of the chunk's contents. whatever
+    the caller reads of a chunk, the file is moved on to the next one by
+    seeking, so the contents of chunks not wanted are never read.
+    """
+    while True:
+        chunk_header = f.read(8)
+        if not chunk_header:
+            return
+        if len(chunk_header) < 8:
+            raise Exception("truncated chunk header")
+        chunk_id = bytes(chunk_header[:4])
+        length, = struct.unpack(">L", chunk_header[4:])
+        start = f.tell()
+        yield chunk_id, start, length
+        f.seek(start + length)
+
+
+class MidiFile(object):
+    """
+    an SMF whose tracks are decoded into OSequences only when first used.
+
+    opening one reads just the header and the lengths of the MTrk chunks;
+    indexing it (midi_file[3]) reads and decodes that one track, which is
+    then kept for later use. ticks is as for load_midi.
+    """
+
+    def __init__(self, filename, ticks=False):
+        self.filename = filename
+        self.ticks = ticks
+        self.format = self.division = None
+        self._chunks = []
+        self._tracks = {}
+        with open(filename, "rb") as f:
+            for chunk_id, start, length in iter_chunk_headers(f):
+                if chunk_id == b"MThd":
+                    self.format, self.num_tracks, self.division = struct.unpack(">HHH", f.read(6))
+                elif chunk_id == b"MTrk":
+                    self._chunks.append((start, length))
+                else:
+                    raise Exception("unknown chunk type")
+        if self.division is None:
+            raise Exception("no header chunk")
+
+    def __len__(self):
+        return len(self._chunks)
+
+    def __getitem__(self, track_num):
+        if track_num < 0:
+            track_num += len(self._chunks)
+            if track_num < 0:
+                raise IndexError("track number out of range")
+        track = self._tracks.get(track_num)
+        if track is None:
+            start, length = self._chunks[track_num]
+            with open(self.filename, "rb") as f:
+                f.seek(start)
+                data = bytearray(length)
+                f.readinto(data)
+            handler = SebastianHandler(self.ticks)
+            handler.header(self.format, len(self._chunks), self.division)
+            Trk(data, handler, 0, length, track_num)
+            track = self._tracks[track_num] = handler.tracks[track_num]
+        return track
+
+    def __iter__(self):
+        for track_num in range(len(self._chunks)):
+            yield self[track_num]
+
+    def tempo_map(self):
+        """
+        returns a TempoMap of the tempo changes in all the tracks, which are
+        read for them but not decoded into sequences
+        """
+        changes = []
+        with open(self.filename, "rb") as f:
+            for start, length in self._chunks:
+                f.seek(start)
+                data = bytearray(length)
+                f.readinto(data)
+                for ticks, status, meta_type, tempo in iter_track_events(data):
+                    if status == 0xFF and meta_type == 0x51:
+                        changes.append((ticks, (tempo[0] << 16) | (tempo[1] << 8) | tempo[2]))
+        return TempoMap(self.division, changes)
+
+
+def load_tempo_map(filename):
+    """
+    returns a TempoMap of the tempo changes in the given SMF, for
+    converting the offsets of points to seconds. the tracks load_midi
+    returns already have one, as their tempo_map, so this is only needed
+    for files not loaded that way.
+    """
+    return MidiFile(filename).tempo_map()
+
+
+# what scan_midi finds in a file. track_names has the name of each track (or
+# None), tempo is in microseconds per quarter note and time_signature and
+# key_signature are the data bytes of those meta events, each as found first
+# in any track, or None if there are none.
+MidiInfo = namedtuple("MidiInfo", "format num_tracks division track_names tempo time_signature key_signature")
+
+# how much of the start of each track scan_midi reads at first
+SCAN_BYTES = 512
+
+
+def _scan_track(data):
+    """
+    returns the (meta_type, data) of the meta events at tick 0 at the start
+    of the track contents data, and whether they were all found (rather than
+    data ending first)
+    """
+    events = []
+    try:
+        for ticks, status, data1, data2 in iter_track_events(data):
+            if ticks > 0:
+                return events, True
+            if status == 0xFF:
+                events.append((data1, bytes(data2)))
+                if data1 == 0x2F:
+                    return events, True
+    except IndexError:
+        pass
+    return events, False
+
+
+def scan_midi(filename):
+    """
+    returns a MidiInfo describing the given SMF without decoding its notes.
+
+    only the start of each track is read, for the meta events at tick 0;
+    the rest is skipped over using the chunk length.
+    """
+    header = None
+    track_names = []
+    found = {}
+    with open(filename, "rb") as f:
+        for chunk_id, start, length in iter_chunk_headers(f):
+            if chunk_id == b"MThd":
+                header = struct.unpack(">HHH", f.read(6))
+            elif chunk_id == b"MTrk":
+                events, complete = _scan_track(bytearray(f.read(min(length, SCAN_BYTES))))
+                if not complete and length > SCAN_BYTES:
+                    f.seek(start)
+                    events, complete = _scan_track(bytearray(f.read(length)))
+                events = dict(reversed(events))  # keeping the first of each type
+                track_names.append(events.get(0x03))
+                for meta_type, data in events.items():
+                    found.setdefault(meta_type, data)
+            else:
+                raise Exception("unknown chunk type")
+    if header is None:
+        raise Exception("no header chunk")
+    tempo = found.get(0x51)
+    if tempo is not None:
+        tempo, = struct.unpack(">L", b"\x00" + tempo)
+    time_signature = found.get(0x58)
+    key_signature = found.get(0x59)
+    return MidiInfo(
+        header[0], header[1], header[2], track_names, tempo,
+        None if time_signature is None else tuple(bytearray(time_signature)),
+        None if key_signature is None else tuple(bytearray(key_signature)),
+    )
 
 
 if __name__ == "__main__":
-    track = -1
     import sys
     filename = sys.argv[1]
     handler = SebastianHandler()
-    SMF(bytearray(open(filename, "rb").read()), handler)
+    SMF(read_file(filename), handler)
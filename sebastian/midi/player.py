@@ -12,16 +12,19 @@ TIMIDITY = "timidity"
 
 
 def play(tracks, program=""):
-    f = tempfile.NamedTemporaryFile(suffix=".mid", delete=False)
-    s = write_midi.SMF(tracks)
-    s.write(f)
-    f.close()
+    data = write_midi.SMF(tracks).to_bytes()
     if not program:
         if sys.platform == "darwin":
             program = OPEN
-        elif sys.platform == "linux2":
+        elif sys.platform.startswith("linux"):
             program = TIMIDITY
-    if program:
+    if program == TIMIDITY:
+        # timidity reads the file from stdin given "-", so needs no file
+        subprocess.Popen([program, "-"], stdin=subprocess.PIPE).communicate(data)
+    elif program:
+        f = tempfile.NamedTemporaryFile(suffix=".mid", delete=False)
+        f.write(data)
+        f.close()
         subprocess.call([program, f.name])
     else:
         print("A suitable program for your platform is unknown")
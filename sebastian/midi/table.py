@@ -0,0 +1,142 @@
+"""
+Loading an SMF into columns of integers rather than sequences of Points.
+
+load_event_table gives two tables: one of notes (with their channel and
+velocity, which load_midi drops) and one of every other event
+(controllers, program changes, meta events and so on). Each column is an
+array that rows are appended to as the file is decoded, so no Point or
+other object is made per event, and with numpy installed a column can be
+had as an array for vectorized analysis:
+
+    table = load_event_table("performance.mid")
+    loud = table.notes.column("velocity") > 100
+"""
+
+import struct
+from array import array
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+from sebastian.midi.midi import iter_chunks, iter_track_events, read_file
+
+
+class Table(object):
+    """
+    rows of integers kept as one growable array per named column
+    """
+
+    typecode = "l"
+
+    def __init__(self, names):
+        self.names = tuple(names)
+        self.columns = dict((name, array(self.typecode)) for name in self.names)
+
+    def __len__(self):
+        return len(self.columns[self.names[0]])
+
+    def append(self, *row):
+        for name, value in zip(self.names, row):
+            self.columns[name].append(value)
+
+    def column(self, name):
+        """
+        returns the named column as a numpy array sharing its memory, or
+        the array itself if numpy isn't installed
+        """
+        values = self.columns[name]
+        if numpy is None:
+            return values
+        if not values:
+            return numpy.zeros(0, dtype=values.typecode)
+        return numpy.frombuffer(values, dtype=values.typecode)
+
+    def rows(self):
+        """
+        generates each row as a tuple
+        """
+        return zip(*[self.columns[name] for name in self.names])
+
+
+class EventTable(object):
+    """
+    the events of an SMF as two Tables.
+
+    notes has a row for each note, with the columns track, tick, duration
+    (both in ticks), channel (1 to 16), pitch and velocity, in the order the
+    notes end. events has a row for every other event, with the columns
+    track, tick, status, data1 and data2 (-1 where the event has no second
+    data byte). for meta events status is 0xFF and data1 the meta event
+    type; their data is in meta_data, by row number.
+    """
+
+    def __init__(self, format, num_tracks, division):
+        self.format = format
+        self.num_tracks = num_tracks
+        self.division = division
+        self.notes = Table(("track", "tick", "duration", "channel", "pitch", "velocity"))
+        self.events = Table(("track", "tick", "status", "data1", "data2"))
+        self.meta_data = {}
+
+    def add_track(self, track, data, start, end):
+        """
+        decodes the MTrk chunk contents data[start:end] into the tables.
+
+        a note is ended by the next note off or note on for the same pitch
+        on the same channel; note offs for notes never started are ignored.
+        """
+        add_track_num, add_tick, add_duration, add_channel, add_pitch, add_velocity = [
+            self.notes.columns[name].append for name in self.notes.names
+        ]
+        add_event_track_num, add_event_tick, add_status, add_data1, add_data2 = [
+            self.events.columns[name].append for name in self.events.names
+        ]
+        started = {}
+        for ticks, status, data1, data2 in iter_track_events(data, start, end):
+            if status < 0xA0:
+                key = (status & 0x0F, data1)
+                if key in started:
+                    start_ticks, velocity = started.pop(key)
+                    add_track_num(track)
+                    add_tick(start_ticks)
+                    add_duration(ticks - start_ticks)
+                    add_channel(key[0] + 1)
+                    add_pitch(data1)
+                    add_velocity(velocity)
+                if status >= 0x90 and data2 > 0:
+                    started[key] = ticks, data2
+                continue
+            if status == 0xFF:
+                self.meta_data[len(self.events)] = bytes(data2)
+                data2 = -1
+            elif data2 is None:
+                data2 = -1
+            add_event_track_num(track)
+            add_event_tick(ticks)
+            add_status(status)
+            add_data1(data1)
+            add_data2(data2)
+
+
+def load_event_table(filename):
+    """
+    returns an EventTable of all the events in the given SMF
+    """
+    data = read_file(filename)
+    table = None
+    track = 0
+    for chunk_id, start, end in iter_chunks(data):
+        if chunk_id == b"MThd":
+            table = EventTable(*struct.unpack_from(">HHH", data, start))
+        elif chunk_id == b"MTrk":
+            if table is None:
+                raise Exception("no header chunk")
+            table.add_track(track, data, start, end)
+            track += 1
+        else:
+            raise Exception("unknown chunk type")
+    if table is None:
+        raise Exception("no header chunk")
+    return table
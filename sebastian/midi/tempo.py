@@ -0,0 +1,80 @@
+"""
+Conversion between MIDI ticks and seconds using a file's tempo changes.
+"""
+
+from bisect import bisect_right
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+
+# the tempo of a file until it says otherwise, in microseconds per quarter
+DEFAULT_TEMPO = 500000
+
+
+class TempoMap(object):
+    """
+    the tempo changes of an SMF, for converting times in ticks to seconds
+    and back.
+
+    changes are (ticks, tempo) pairs, tempo in microseconds per quarter
+    note, in any order; of several at the same tick the last given is used.
+    the time in seconds of each change is worked out once, so converting a
+    time is a binary search for the change before it and one multiply.
+
+    the conversions take a single time or a sequence of them; a sequence
+    gives a numpy array if numpy is installed and a list otherwise.
+    """
+
+    def __init__(self, division, changes=()):
+        self.division = division
+        tempos = {0: DEFAULT_TEMPO}
+        for ticks, tempo in changes:
+            tempos[ticks] = tempo
+        self.ticks = sorted(tempos)
+        self.tempos = [tempos[ticks] for ticks in self.ticks]
+        # the time in seconds each tempo starts
+        self.seconds = [0.0]
+        for n in range(1, len(self.ticks)):
+            self.seconds.append(self.seconds[-1] + self._seconds_per_tick(n - 1) * (self.ticks[n] - self.ticks[n - 1]))
+
+    def _seconds_per_tick(self, n):
+        return self.tempos[n] / (1000000.0 * self.division)
+
+    def _convert_one(self, value, starts, other_starts, rate):
+        n = max(bisect_right(starts, value) - 1, 0)
+        return other_starts[n] + (value - starts[n]) * rate(n)
+
+    def _convert(self, values, starts, other_starts, inverse):
+        if inverse:
+            def rate(n):
+                return 1 / self._seconds_per_tick(n)
+        else:
+            rate = self._seconds_per_tick
+        if not hasattr(values, "__iter__"):
+            return self._convert_one(values, starts, other_starts, rate)
+        if numpy is None:
+            return [self._convert_one(value, starts, other_starts, rate) for value in values]
+        values = numpy.asarray(values, dtype=float)
+        n = numpy.maximum(numpy.searchsorted(starts, values, side="right") - 1, 0)
+        rates = numpy.array([rate(m) for m in range(len(starts))])
+        return numpy.asarray(other_starts)[n] + (values - numpy.asarray(starts, dtype=float)[n]) * rates[n]
+
+    def ticks_to_seconds(self, ticks):
+        return self._convert(ticks, self.ticks, self.seconds, False)
+
+    def seconds_to_ticks(self, seconds):
+        return self._convert(seconds, self.seconds, self.ticks, True)
+
+    def offsets_to_seconds(self, offsets_64):
+        """
+        converts offset_64 values (as load_midi gives points) to seconds
+        """
+        scale = self.division / 16.0
+        if not hasattr(offsets_64, "__iter__"):
+            return self.ticks_to_seconds(offsets_64 * scale)
+        if numpy is None:
+            return self.ticks_to_seconds([offset * scale for offset in offsets_64])
+        return self.ticks_to_seconds(numpy.asarray(offsets_64, dtype=float) * scale)
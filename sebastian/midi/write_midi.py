@@ -1,6 +1,9 @@
 #!/usr/bin/env python
 
+import heapq
+import struct
 from io import BytesIO
+
 import six
 
 from sebastian.core import OFFSET_64, MIDI_PITCH, DURATION_64
@@ -14,27 +17,127 @@ def write_byte(out, b):
     out.write(six.int2byte(b))
 
 
+_ushort = struct.Struct(">H").pack
+_ulong = struct.Struct(">L").pack
+_two_bytes = struct.Struct(">BB").pack
+_three_bytes = struct.Struct(">BBB").pack
+
+
 def write_ushort(out, s):
-    write_byte(out, (s >> 8) % 256)
-    write_byte(out, (s >> 0) % 256)
+    out.write(_ushort(s % 0x10000))
 
 
 def write_ulong(out, l):
-    write_byte(out, (l >> 24) % 256)
-    write_byte(out, (l >> 16) % 256)
-    write_byte(out, (l >> 8) % 256)
-    write_byte(out, (l >> 0) % 256)
+    out.write(_ulong(l % 0x100000000))
 
 
-def write_varlen(out, n):
-    data = six.int2byte(n & 0x7F)
-    while True:
+def _encode_varlen(n):
+    data = bytearray([n & 0x7F])
+    n = n >> 7
+    while n:
+        data.insert(0, (n & 0x7F) | 0x80)
         n = n >> 7
-        if n:
-            data = six.int2byte((n & 0x7F) | 0x80) + data
-        else:
-            break
-    out.write(data)
+    return bytes(data)
+
+
+# the encodings of all the numbers that fit in two bytes, which covers
+# nearly every time delta
+VARLEN_TABLE_SIZE = 0x4000
+_varlens = [_encode_varlen(n) for n in range(VARLEN_TABLE_SIZE)]
+
+
+def varlen(n):
+    """
+    returns n encoded as a MIDI variable length quantity
+    """
+    if 0 <= n < VARLEN_TABLE_SIZE:
+        return _varlens[n]
+    if n < 0:
+        raise ValueError("negative variable length quantity %d" % n)
+    return _encode_varlen(n)
+
+
+def write_varlen(out, n):
+    out.write(varlen(n))
+
+
+class TrackData(bytearray):
+    """
+    the bytes of a track as it is built up. as well as being a bytearray it
+    has the write and getvalue methods of a BytesIO, for the write_...
+    functions above and for callers expecting one.
+    """
+
+    def write(self, data):
+        self.extend(data)
+
+    def getvalue(self):
+        return bytes(self)
+
+
+def iter_note_events(points):
+    """
+    returns an iterator of (on, offset, midi_pitch, velocity) for the note
+    on and note off of each point with a midi_pitch, in offset order (where
+    offsets are equal, in the order of the points, a note's on before its
+    off).
+
+    if the points are an OSequence already in offset order (as they
+    usually are) the note offs waiting to happen are kept in a heap and
+    merged with the note ons as they go, without making or sorting a list
+    of them all. otherwise all the events are sorted.
+    """
+    is_sorted = getattr(points, "is_sorted", None)
+    # is_sorted doesn't notice offsets changed in place on points got by
+    # iterating, so the order is checked before relying on it
+    if is_sorted is not None and is_sorted() and _in_note_order(points):
+        return _merged_note_events(points)
+    events_with_noteoff = []
+    for point in points:
+        offset, note_value, duration = point.tuple(OFFSET_64, MIDI_PITCH, DURATION_64)
+        velocity = 64 if 'velocity' not in point else point['velocity']
+        if note_value is not None:
+            events_with_noteoff.append((True, offset, note_value, velocity))
+            events_with_noteoff.append((False, offset + duration, note_value, velocity))
+    return iter(sorted(events_with_noteoff, key=lambda x: x[1]))
+
+
+def _in_note_order(points):
+    # whether the notes' offsets never go down and none ends before it
+    # starts, so merging gives the note offs in order
+    last = None
+    for point in points:
+        if point.get(MIDI_PITCH) is None:
+            continue
+        offset = point.get(OFFSET_64)
+        if (last is not None and offset < last) or point.get(DURATION_64) < 0:
+            return False
+        last = offset
+    return True
+
+
+def _merged_note_events(points):
+    # (offset, number, midi_pitch, velocity) of each note off to come, the
+    # number keeping those at the same offset in the order of their points
+    pending = []
+    number = 0
+    for point in points:
+        note_value = point.get(MIDI_PITCH)
+        if note_value is None:
+            continue
+        offset = point.get(OFFSET_64)
+        velocity = point.get('velocity', 64)
+        # a note off at the same offset as this note on is from an earlier
+        # point, so comes first
+        while pending and pending[0][0] <= offset:
+            off_offset, _, off_value, off_velocity = heapq.heappop(pending)
+            yield False, off_offset, off_value, off_velocity
+        yield True, offset, note_value, velocity
+        heapq.heappush(pending, (offset + point.get(DURATION_64), number, note_value, velocity))
+        number += 1
+    while pending:
+        off_offset, _, off_value, off_velocity = heapq.heappop(pending)
+        yield False, off_offset, off_value, off_velocity
 
 
 class SMF(object):
@@ -53,8 +156,9 @@ class SMF(object):
         self, out,
         title="untitled",  # distinct from filename
         time_signature=(4, 2, 24, 8),  # (2nd arg is power of 2)
-        key_signature = (0, 0),  # C
-        tempo = 500000  # in microseconds per quarter note
+        key_signature=(0, 0),  # C
+        tempo=500000,  # in microseconds per quarter note
+        compact=False  # use running status and note ons for note offs
     ):
         num_tracks = 1 + len(self.tracks)
         Thd(format=1, num_tracks=num_tracks, division=16).write(out)
@@ -83,34 +187,23 @@ class SMF(object):
             # set the instrument this channel is set for
             t.program_change(channel, self.instruments[channel])
 
-            # we make a list of events including note off events so we can sort by
-            # offset including them (to avoid negative time deltas)
+            # the events including note off events, in offset order (to avoid
+            # negative time deltas)
             # @@@ this may eventually be a feature of sequences rather than this
             # MIDI library
-
-            events_with_noteoff = []
-            for point in track:
-                offset, note_value, duration = point.tuple(OFFSET_64, MIDI_PITCH, DURATION_64)
-                velocity = 64 if 'velocity' not in point else point['velocity']
-                if note_value is not None:
-                    events_with_noteoff.append((True, offset, note_value, velocity))
-                    events_with_noteoff.append((False, offset + duration, note_value, velocity))
-
-            prev_offset = None
-            for on, offset, note_value, velocity in sorted(events_with_noteoff, key=lambda x: x[1]):
-                if prev_offset is None:
-                    time_delta = 0
-                else:
-                    time_delta = (offset - prev_offset) * T
-                if on:
-                    t.start_note(time_delta, channel, note_value, velocity)
-                else:
-                    t.end_note(time_delta, channel, note_value)
-                prev_offset = offset
+            t.note_events(channel, iter_note_events(track), T, compact)
 
             t.track_end()
             t.write(out)
 
+    def to_bytes(self, **kws):
+        """
+        returns the SMF as bytes, taking the same options as write
+        """
+        out = BytesIO()
+        self.write(out, **kws)
+        return out.getvalue()
+
 
 class Thd(object):
 
@@ -130,7 +223,7 @@ class Thd(object):
 class Trk(object):
 
     def __init__(self):
-        self.data = BytesIO()
+        self.data = TrackData()
 
     def write_meta_info(self, byte1, byte2, data):
         "Worker method for writing meta info"
@@ -183,16 +276,51 @@ class Trk(object):
         write_byte(self.data, program)
 
     def start_note(self, time_delta, channel, note_number, velocity=64):
-        write_varlen(self.data, time_delta)
-        write_byte(self.data, 0x90 + channel)
-        write_byte(self.data, note_number)
-        write_byte(self.data, max(min(velocity, 255), 0))  # velocity
+        self.data += varlen(time_delta)
+        self.data += _three_bytes(0x90 + channel, note_number, max(min(velocity, 255), 0))
 
     def end_note(self, time_delta, channel, note_number):
-        write_varlen(self.data, time_delta)
-        write_byte(self.data, 0x80 + channel)
-        write_byte(self.data, note_number)
-        write_byte(self.data, 0)  # velocity
+        self.data += varlen(time_delta)
+        self.data += _three_bytes(0x80 + channel, note_number, 0)
+
+    def note_events(self, channel, events, scale=1, compact=False):
+        """
+        writes (on, offset, note_number, velocity) events, in offset order,
+        as note ons (if on is true) and note offs, giving the first a time
+        delta of 0 and the rest the difference in offset times scale. the
+        same as calling start_note and end_note for each, only faster.
+
+        if compact is True note offs are written as note ons with a velocity
+        of 0, and the status byte is left out (running status) of each event
+        after the first, as all are then note ons on the same channel.
+        """
+        data = self.data
+        varlens = _varlens
+        on_status = 0x90 + channel
+        off_status = on_status if compact else 0x80 + channel
+        status = None
+        prev_offset = None
+        for on, offset, note_number, velocity in events:
+            if prev_offset is None:
+                time_delta = 0
+            else:
+                time_delta = (offset - prev_offset) * scale
+            if 0 <= time_delta < VARLEN_TABLE_SIZE:
+                data += varlens[time_delta]
+            else:
+                data += varlen(time_delta)
+            if on:
+                event_status = on_status
+                velocity = max(min(velocity, 255), 0)
+            else:
+                event_status = off_status
+                velocity = 0
+            if compact and event_status == status:
+                data += _two_bytes(note_number, velocity)
+            else:
+                data += _three_bytes(event_status, note_number, velocity)
+            status = event_status
+            prev_offset = offset
 
     def track_end(self):
         write_varlen(self.data, 0)  # tick
@@ -201,14 +329,112 @@ class Trk(object):
         write_varlen(self.data, 0)
 
     def write(self, out):
-        write_chars(out, "MTrk")
-        d = self.data.getvalue()
-        write_ulong(out, len(d))
-        out.write(d)
+        out.write(b"MTrk" + _ulong(len(self.data)))
+        out.write(self.data)
+
+
+class SMFWriter(object):
+    """
+    writes an SMF straight to a seekable binary file, one track at a time,
+    from iterators of events, so a track never has to be held in memory.
+
+    events are (ticks, status, data1, data2) tuples, as
+    sebastian.midi.midi.iter_track_events generates, in time order: ticks
+    is the time from the start of the track, data2 is None for channel
+    events with one data byte, and meta events have a status of 0xFF, the
+    meta event type as data1 and its data as data2.
+
+    each track's chunk length is written as a placeholder and filled in
+    once the track is done, as is the number of tracks in the header when
+    the writer is closed.
+
+        with open("long.mid", "wb") as f:
+            with SMFWriter(f) as writer:
+                writer.write_track(tempo_events)
+                writer.write_track(generate_events())
+
+    closing the writer doesn't close the file, which stays the caller's.
+    """
+
+    # how much of a track is built up before it is written out
+    buffer_size = 0x10000
+
+    def __init__(self, out, format=1, division=16):
+        self.out = out
+        self.num_tracks = 0
+        self.start = out.tell()
+        Thd(format=format, num_tracks=0, division=division).write(out)
+
+    def write_track(self, events):
+        """
+        writes an MTrk chunk of the given events, adding the track end meta
+        event if the events don't end with one
+        """
+        out = self.out
+        length_at = out.tell() + 4
+        out.write(b"MTrk\x00\x00\x00\x00")
+        length = 0
+        data = TrackData()
+        prev_ticks = 0
+        ended = False
+        for ticks, status, data1, data2 in events:
+            if ended:
+                raise ValueError("event after track end")
+            if ticks < prev_ticks:
+                raise ValueError("events out of time order")
+            data += varlen(ticks - prev_ticks)
+            if status == 0xFF:
+                data.append(0xFF)
+                data.append(data1)
+                data += varlen(len(data2))
+                data += data2
+                ended = data1 == 0x2F
+            elif data2 is None:
+                data.append(status)
+                data.append(data1)
+            else:
+                data += _three_bytes(status, data1, data2)
+            prev_ticks = ticks
+            if len(data) >= self.buffer_size:
+                out.write(data)
+                length += len(data)
+                del data[:]
+        if not ended:
+            data += b"\x00\xFF\x2F\x00"
+        out.write(data)
+        length += len(data)
+
+        end = out.tell()
+        out.seek(length_at)
+        out.write(_ulong(length))
+        out.seek(end)
+        self.num_tracks += 1
+
+    def close(self):
+        """
+        fills in the number of tracks written in the header
+        """
+        end = self.out.tell()
+        self.out.seek(self.start + 10)
+        self.out.write(_ushort(self.num_tracks))
+        self.out.seek(end)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
 
 
 def write(filename, tracks, instruments=None, **kws):
-    with open(filename, "w") as f:
-        s = SMF(tracks, instruments=instruments)
-        # pass on some attributes, such as tempo, key, etc.
-        s.write(f, **kws)
+    """
+    writes an SMF of the given tracks to filename, which may also be a
+    binary file object (anything with a write method) to write to
+    """
+    s = SMF(tracks, instruments=instruments)
+    # pass on some attributes, such as tempo, key, etc.
+    if hasattr(filename, "write"):
+        s.write(filename, **kws)
+    else:
+        with open(filename, "wb") as f:
+            s.write(f, **kws)
@@ -0,0 +1,29 @@
+import os
+import tempfile
+
+
+class TempMidiFiles(object):
+    """
+    a mixin for TestCases that need MIDI files on disk, removing those made
+    with write_temp_midi once each test is done
+    """
+
+    def write_temp_midi(self, tracks_or_bytes, **options):
+        """
+        writes the given bytes, or an SMF of the given tracks (passing any
+        options on to SMF.write), to a new temporary file, returning its name
+        """
+        from sebastian.midi.write_midi import SMF
+        fd, filename = tempfile.mkstemp(suffix=".mid")
+        # not addCleanup, which Python 2.6 doesn't have
+        self.__dict__.setdefault("_temp_midi_files", []).append(filename)
+        with os.fdopen(fd, "wb") as f:
+            if isinstance(tracks_or_bytes, bytes):
+                f.write(tracks_or_bytes)
+            else:
+                SMF(tracks_or_bytes).write(f, **options)
+        return filename
+
+    def tearDown(self):
+        for filename in self.__dict__.pop("_temp_midi_files", []):
+            os.remove(filename)
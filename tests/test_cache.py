@@ -0,0 +1,119 @@
+from unittest import TestCase
+
+
+class TestCache(TestCase):
+
+    def make_sequence(self, offset=0):
+        from sebastian.core import OSequence, Point
+        from sebastian.core import OFFSET_64, DURATION_64
+        return OSequence([
+            Point({OFFSET_64: 16 + offset, "pitch": 50 + offset, DURATION_64: 17}),
+            Point({OFFSET_64: 19 + offset, "pitch": 53 + offset, DURATION_64: 20}),
+        ])
+
+    def setUp(self):
+        from sebastian.core.cache import enable_transform_cache
+        self.cache = enable_transform_cache(maxsize=2)
+
+    def tearDown(self):
+        from sebastian.core.cache import disable_transform_cache
+        disable_transform_cache()
+
+    def test_fingerprint(self):
+        """
+        Ensure sequences with the same points have the same fingerprint
+        """
+        from sebastian.core import OFFSET_64
+        s1 = self.make_sequence()
+        s2 = self.make_sequence()
+        self.assertEqual(s1.fingerprint(), s2.fingerprint())
+        self.assertNotEqual(s1.fingerprint(), self.make_sequence(1).fingerprint())
+        s2.append({OFFSET_64: 40})
+        self.assertNotEqual(s1.fingerprint(), s2.fingerprint())
+        s1[0]["pitch"] = 0
+        self.assertNotEqual(s1.fingerprint(), self.make_sequence().fingerprint())
+
+    def test_transform_cache_hits(self):
+        """
+        Ensure a transform of the same points is only worked out once
+        """
+        from sebastian.core.transforms import transpose
+        transposed = self.make_sequence() | transpose(12)
+        self.assertEqual((self.cache.hits, self.cache.misses), (0, 1))
+        again = self.make_sequence() | transpose(12)
+        self.assertEqual((self.cache.hits, self.cache.misses), (1, 1))
+        self.assertEqual(again, transposed)
+        self.make_sequence() | transpose(12.0)
+        self.assertEqual((self.cache.hits, self.cache.misses), (1, 2))
+
+    def test_transform_cache_compares_points(self):
+        """
+        Ensure sequences whose fingerprints collide don't share results
+        """
+        from sebastian.core import OSequence, Point
+        from sebastian.core.transforms import transpose
+        s1 = OSequence(Point(pitch=-1))
+        s2 = OSequence(Point(pitch=-2))
+        self.assertEqual(s1.fingerprint(), s2.fingerprint())
+        self.assertEqual((s1 | transpose(1))[0]["pitch"], 0)
+        self.assertEqual((s2 | transpose(1))[0]["pitch"], -1)
+        self.assertEqual((self.cache.hits, self.cache.misses), (0, 2))
+
+    def test_transform_cache_results_are_independent(self):
+        """
+        Ensure changing a cached result doesn't change later results
+        """
+        from sebastian.core.transforms import transpose
+        transposed = self.make_sequence() | transpose(12)
+        transposed[0]["pitch"] = 0
+        again = self.make_sequence() | transpose(12)
+        self.assertEqual(again[0]["pitch"], 62)
+
+    def test_transform_cache_evicts_least_recently_used(self):
+        """
+        Ensure the cache holds no more than maxsize results
+        """
+        from sebastian.core.transforms import transpose
+        s1 = self.make_sequence()
+        s1 | transpose(1)
+        s1 | transpose(2)
+        s1 | transpose(1)
+        s1 | transpose(3)
+        self.assertEqual(len(self.cache), 2)
+        self.assertEqual(self.cache.evictions, 1)
+        s1 | transpose(1)
+        self.assertEqual(self.cache.hits, 2)
+        s1 | transpose(2)
+        self.assertEqual(self.cache.misses, 4)
+
+    def test_transform_cache_compares_point_value_types(self):
+        """
+        Ensure points that are equal but have values of other types don't
+        share results
+        """
+        from sebastian.core import OSequence, Point
+        from sebastian.core.transforms import transpose
+        results = [
+            (OSequence(Point(pitch=pitch)) | transpose(0))[0]["pitch"]
+            for pitch in [1, 1.0, True]
+        ]
+        self.assertEqual([type(pitch) for pitch in results], [int, float, int])
+        self.assertEqual((self.cache.hits, self.cache.misses), (0, 3))
+
+    def test_linked_dict_evicts_in_order(self):
+        """
+        Ensure the Python 2.6 stand-in for OrderedDict evicts the least
+        recently used result
+        """
+        from sebastian.core.cache import TransformCache, _LinkedDict
+        cache = TransformCache(maxsize=2)
+        cache._results = _LinkedDict()
+        cache.put("a", 1)
+        cache.put("b", 2)
+        self.assertEqual(cache.get("a"), 1)
+        cache.put("c", 3)
+        self.assertEqual(len(cache), 2)
+        self.assertEqual(cache.get("b"), None)
+        self.assertEqual((cache.get("a"), cache.get("c")), (1, 3))
+        cache.clear()
+        self.assertEqual(len(cache), 0)
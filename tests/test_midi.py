@@ -2,8 +2,10 @@ from unittest import TestCase
 
 from sebastian.midi.midi import load_midi
 
+from midi_files import TempMidiFiles
 
-class TestMidi(TestCase):
+
+class TestMidi(TempMidiFiles, TestCase):
 
     def test_load_midi(self):
         import os.path
@@ -28,3 +30,359 @@ class TestMidi(TestCase):
                 {'midi_pitch': 60, 'offset_64': 154, 'duration_64': 13},
             ]
         )
+
+    def test_round_trip(self):
+        from sebastian.core import OSequence, Point, OFFSET_64, MIDI_PITCH, DURATION_64
+        points = [
+            Point({OFFSET_64: 16 * n, MIDI_PITCH: 48 + n % 24, DURATION_64: 8 + n % 8})
+            for n in range(200)
+        ]
+        tracks = load_midi(self.write_temp_midi([OSequence(points)]))
+        self.assertEqual(len(tracks), 2)
+        self.assertEqual(list(tracks[0]), [])
+        self.assertEqual(list(tracks[1]), points)
+
+    def test_load_midi_processes(self):
+        from sebastian.core import OSequence, Point, OFFSET_64, MIDI_PITCH, DURATION_64
+        tracks = [
+            OSequence([Point({OFFSET_64: 8 * n, MIDI_PITCH: 40 + t, DURATION_64: 4}) for n in range(50)])
+            for t in range(5)
+        ]
+        filename = self.write_temp_midi(tracks)
+        loaded = load_midi(filename, processes=2)
+        self.assertEqual(
+            [list(track) for track in loaded],
+            [list(track) for track in load_midi(filename)]
+        )
+        self.assertEqual([list(track) for track in loaded[1:]], [list(track) for track in tracks])
+
+    def test_load_many(self):
+        from sebastian.core import OSequence, Point, OFFSET_64, MIDI_PITCH, DURATION_64
+        from sebastian.midi.midi import load_many
+        filenames = []
+        expected = []
+        for n in range(6):
+            tracks = [
+                OSequence([Point({OFFSET_64: 0, MIDI_PITCH: 40 + n + t, DURATION_64: 4 + t})])
+                for t in range(n + 1)
+            ]
+            filenames.append(self.write_temp_midi(tracks))
+            expected.append([[]] + [list(track) for track in tracks])
+        loaded = load_many(filenames, workers=3)
+        self.assertEqual([[list(track) for track in tracks] for tracks in loaded], expected)
+
+    def test_ticks(self):
+        from sebastian.core import OFFSET_64, MIDI_PITCH, DURATION_64, TICKS, DURATION_TICKS, DIVISION
+        from sebastian.core.storage import ColumnStore
+        data = (
+            b"MThd\x00\x00\x00\x06\x00\x00\x00\x01\x01\xE0"  # division 480
+            b"MTrk\x00\x00\x00\x0C"
+            b"\x07\x90\x3C\x40"
+            b"\x71\x80\x3C\x00"
+            b"\x00\xFF\x2F\x00"
+        )
+        filename = self.write_temp_midi(data)
+        loaded = load_midi(filename, ticks=True)
+        in_processes = load_midi(filename, processes=1, ticks=True)
+        plain = load_midi(filename)
+        self.assertTrue(isinstance(loaded[0]._elements, ColumnStore))
+        self.assertEqual(list(loaded[0]), [{
+            OFFSET_64: 0, MIDI_PITCH: 60, DURATION_64: 3,
+            TICKS: 7, DURATION_TICKS: 113, DIVISION: 480,
+        }])
+        self.assertEqual(list(in_processes[0]), list(loaded[0]))
+        self.assertEqual(list(plain[0]), [{OFFSET_64: 0, MIDI_PITCH: 60, DURATION_64: 3}])
+
+    def test_iter_track_events(self):
+        from sebastian.midi.midi import iter_track_events
+        data = bytearray([
+            0x00, 0xFF, 0x03, 0x02, 0x68, 0x69,  # track name
+            0x00, 0x90, 0x3C, 0x40,  # note on
+            0x81, 0x00, 0x3E, 0x40,  # running status note on, 128 ticks later
+            0x10, 0x80, 0x3C, 0x00,  # note off
+            0x00, 0xC0, 0x05,  # program change
+            0x00, 0xFF, 0x2F, 0x00,  # track end
+        ])
+        self.assertEqual(
+            [(ticks, status, data1, data2) for ticks, status, data1, data2 in iter_track_events(data)],
+            [
+                (0, 0xFF, 0x03, bytearray(b"hi")),
+                (0, 0x90, 0x3C, 0x40),
+                (128, 0x90, 0x3E, 0x40),
+                (144, 0x80, 0x3C, 0x00),
+                (144, 0xC0, 0x05, None),
+                (144, 0xFF, 0x2F, bytearray()),
+            ]
+        )
+
+    def test_unstarted_note_off_ignored(self):
+        from sebastian.midi.midi import SMF, BaseHandler
+
+        class NoteHandler(BaseHandler):
+            def __init__(self):
+                self.notes = []
+
+            def note(self, offset, channel, midi_pitch, duration):
+                self.notes.append((offset, channel, midi_pitch, duration))
+
+        data = bytearray(
+            b"MThd\x00\x00\x00\x06\x00\x00\x00\x01\x00\x10"
+            b"MTrk\x00\x00\x00\x10"
+            b"\x00\x80\x3E\x00"  # note off for a note never started
+            b"\x00\x90\x3C\x40"
+            b"\x08\x80\x3C\x00"
+            b"\x00\xFF\x2F\x00"
+        )
+        handler = NoteHandler()
+        SMF(data, handler)
+        self.assertEqual(handler.notes, [(0, 1, 0x3C, 8)])
+
+    def test_controller_time_delta(self):
+        from sebastian.midi.midi import SMF, BaseHandler
+
+        class ControllerHandler(BaseHandler):
+            def __init__(self):
+                self.events = []
+
+            def controller(self, time_delta, channel, controller, value):
+                self.events.append(("controller", time_delta, channel, controller, value))
+
+            def program_change(self, time_delta, channel, program):
+                self.events.append(("program_change", time_delta, channel, program))
+
+        data = bytearray(
+            b"MThd\x00\x00\x00\x06\x00\x00\x00\x01\x00\x10"
+            b"MTrk\x00\x00\x00\x13"
+            b"\x00\x90\x3C\x40"
+            b"\x08\x80\x3C\x00"
+            b"\x05\xB0\x07\x64"  # controller 5 ticks after the note off
+            b"\x03\xC0\x02"
+            b"\x00\xFF\x2F\x00"
+        )
+        handler = ControllerHandler()
+        SMF(data, handler)
+        self.assertEqual(handler.events, [
+            ("controller", 5, 1, 0x07, 0x64),
+            ("program_change", 3, 1, 0x02),
+        ])
+
+
+class TestIterEvents(TempMidiFiles, TestCase):
+
+    def setUp(self):
+        from io import BytesIO
+        from sebastian.core import OSequence, Point, OFFSET_64, MIDI_PITCH, DURATION_64
+        from sebastian.midi.write_midi import SMF
+        out = BytesIO()
+        SMF([
+            OSequence([Point({OFFSET_64: 0, MIDI_PITCH: 60, DURATION_64: 8}), Point({OFFSET_64: 16, MIDI_PITCH: 62, DURATION_64: 8})]),
+            OSequence([Point({OFFSET_64: 0, MIDI_PITCH: 48, DURATION_64: 20})]),
+        ]).write(out)
+        self.data = out.getvalue()
+
+    def notes(self, events):
+        from sebastian.midi.midi import NoteOn, NoteOff
+        return [
+            (type(event).__name__, event.track, event.ticks, event.midi_pitch)
+            for event in events if isinstance(event, (NoteOn, NoteOff))
+        ]
+
+    def test_track_by_track(self):
+        from io import BytesIO
+        from sebastian.midi.midi import iter_events
+        self.assertEqual(self.notes(iter_events(BytesIO(self.data))), [
+            ("NoteOn", 1, 0, 60), ("NoteOff", 1, 8, 60),
+            ("NoteOn", 1, 16, 62), ("NoteOff", 1, 24, 62),
+            ("NoteOn", 2, 0, 48), ("NoteOff", 2, 20, 48),
+        ])
+
+    def test_merged(self):
+        from sebastian.midi.midi import iter_events
+        self.assertEqual(self.notes(iter_events(bytearray(self.data), merged=True)), [
+            ("NoteOn", 1, 0, 60), ("NoteOn", 2, 0, 48), ("NoteOff", 1, 8, 60),
+            ("NoteOn", 1, 16, 62), ("NoteOff", 2, 20, 48), ("NoteOff", 1, 24, 62),
+        ])
+
+    def test_event_types(self):
+        from sebastian.midi.midi import iter_events, MetaEvent, ProgramChange
+        events = list(iter_events(bytearray(self.data)))
+        self.assertEqual(events[0], MetaEvent(0, 0, 0x58, b"\x04\x02\x18\x08"))
+        self.assertEqual(events[-1], MetaEvent(2, 20, 0x2F, b""))
+        self.assertTrue(ProgramChange(1, 0, 1, 0) in events)
+
+
+class TestScanMidi(TempMidiFiles, TestCase):
+
+    def test_scan_midi(self):
+        from sebastian.core import OSequence, Point, OFFSET_64, MIDI_PITCH, DURATION_64
+        from sebastian.midi.midi import scan_midi
+        info = scan_midi(self.write_temp_midi(
+            [OSequence([Point({OFFSET_64: 16 * n, MIDI_PITCH: 60, DURATION_64: 8}) for n in range(500)])],
+            title="scanned" * 100, key_signature=(1, 0), tempo=400000
+        ))
+        self.assertEqual(info.format, 1)
+        self.assertEqual(info.num_tracks, 2)
+        self.assertEqual(info.division, 16)
+        self.assertEqual(info.track_names, [b"scanned" * 100, None])
+        self.assertEqual(info.tempo, 400000)
+        self.assertEqual(info.time_signature, (4, 2, 24, 8))
+        self.assertEqual(info.key_signature, (1, 0))
+
+
+class TestMidiFile(TempMidiFiles, TestCase):
+
+    def test_track_selection(self):
+        from sebastian.core import OSequence, Point, OFFSET_64, MIDI_PITCH, DURATION_64
+        from sebastian.midi.midi import MidiFile
+        tracks = [
+            OSequence([Point({OFFSET_64: 8 * n, MIDI_PITCH: 40 + t, DURATION_64: 4}) for n in range(20)])
+            for t in range(4)
+        ]
+        filename = self.write_temp_midi(tracks)
+        selected = load_midi(filename, tracks=[3, 1])
+        midi_file = MidiFile(filename)
+        self.assertEqual((len(midi_file), midi_file.division), (5, 16))
+        self.assertEqual(midi_file._tracks, {})
+        self.assertEqual(list(midi_file[-1]), list(tracks[3]))
+        self.assertEqual(list(midi_file._tracks), [4])
+        self.assertTrue(midi_file[4] is midi_file[-1])
+        self.assertEqual([list(track) for track in midi_file], [[]] + [list(track) for track in tracks])
+        self.assertEqual([list(track) for track in selected], [list(tracks[2]), list(tracks[0])])
+
+    def test_track_out_of_range(self):
+        from sebastian.midi.midi import MidiFile
+        midi_file = MidiFile(self.write_temp_midi([]))
+        self.assertEqual(len(midi_file), 1)
+        self.assertEqual(list(midi_file[-1]), [])
+        self.assertRaises(IndexError, lambda: midi_file[-2])
+        self.assertRaises(IndexError, lambda: midi_file[1])
+
+
+class TestMidiCache(TestCase):
+
+    def setUp(self):
+        import os
+        import tempfile
+        from sebastian.core import OSequence, Point, OFFSET_64, MIDI_PITCH, DURATION_64
+        from sebastian.midi.write_midi import SMF
+        self.directory = tempfile.mkdtemp()
+        self.filenames = []
+        for n in range(3):
+            filename = os.path.join(self.directory, "%d.mid" % n)
+            with open(filename, "wb") as f:
+                SMF([
+                    OSequence([Point({OFFSET_64: 8 * i, MIDI_PITCH: 50 + n, DURATION_64: 4}) for i in range(100)])
+                ]).write(f)
+            self.filenames.append(filename)
+
+    def tearDown(self):
+        import shutil
+        from sebastian.midi.cache import disable_midi_cache
+        disable_midi_cache()
+        shutil.rmtree(self.directory)
+
+    def test_hits_and_misses(self):
+        import os
+        from sebastian.midi.cache import enable_midi_cache
+        cache = enable_midi_cache(os.path.join(self.directory, "cache"))
+        first = [list(track) for track in load_midi(self.filenames[0])]
+        self.assertEqual((cache.hits, cache.misses, len(cache)), (0, 1, 1))
+        second = [list(track) for track in load_midi(self.filenames[0])]
+        self.assertEqual((cache.hits, cache.misses), (1, 1))
+        self.assertEqual(cache.bytes_saved, os.path.getsize(self.filenames[0]))
+        self.assertEqual(first, second)
+        self.assertEqual(len(first[1]), 100)
+
+    def test_eviction(self):
+        import os
+        from sebastian.midi.cache import enable_midi_cache
+        directory = os.path.join(self.directory, "cache")
+        cache = enable_midi_cache(directory)
+        load_midi(self.filenames[0])
+        entry_size = sum(os.path.getsize(os.path.join(directory, name)) for name in os.listdir(directory))
+        cache.max_bytes = 2 * entry_size
+        for filename in self.filenames:
+            load_midi(filename)
+        self.assertEqual(len(cache), 2)
+        self.assertEqual(cache.evictions, 1)
+
+
+class TestTempoMap(TempMidiFiles, TestCase):
+
+    def make_tempo_map(self):
+        from sebastian.midi.tempo import TempoMap
+        # 1 second per quarter (of 96 ticks) from tick 96, then half that
+        return TempoMap(96, [(192, 500000), (96, 1000000)])
+
+    def test_ticks_to_seconds(self):
+        tempo_map = self.make_tempo_map()
+        self.assertEqual(tempo_map.ticks_to_seconds(0), 0)
+        self.assertEqual(tempo_map.ticks_to_seconds(48), 0.25)
+        self.assertEqual(tempo_map.ticks_to_seconds(144), 1.0)
+        self.assertEqual(tempo_map.ticks_to_seconds(288), 2.0)
+        self.assertEqual(list(tempo_map.ticks_to_seconds([288, 0, 144])), [2.0, 0.0, 1.0])
+        self.assertEqual(list(tempo_map.offsets_to_seconds([0, 16, 32, 48])), [0.0, 0.5, 1.5, 2.0])
+
+    def test_seconds_to_ticks(self):
+        tempo_map = self.make_tempo_map()
+        self.assertEqual(tempo_map.seconds_to_ticks(1.0), 144)
+        self.assertEqual(list(tempo_map.seconds_to_ticks([0.25, 2.0])), [48, 288])
+
+    def test_without_numpy(self):
+        from sebastian.midi import tempo
+        numpy, tempo.numpy = tempo.numpy, None
+        try:
+            self.assertEqual(self.make_tempo_map().ticks_to_seconds([288, 0, 144]), [2.0, 0.0, 1.0])
+        finally:
+            tempo.numpy = numpy
+
+    def test_load_tempo_map(self):
+        from sebastian.core import OSequence, Point, OFFSET_64, MIDI_PITCH, DURATION_64
+        from sebastian.midi.midi import load_tempo_map
+        tempo_map = load_tempo_map(self.write_temp_midi(
+            [OSequence([Point({OFFSET_64: 0, MIDI_PITCH: 60, DURATION_64: 16})])], tempo=250000
+        ))
+        self.assertEqual(tempo_map.offsets_to_seconds(32), 0.5)
+
+    def test_load_midi_tempo_map(self):
+        from sebastian.core import OSequence, Point, OFFSET_64, MIDI_PITCH, DURATION_64
+        filename = self.write_temp_midi(
+            [OSequence([Point({OFFSET_64: 0, MIDI_PITCH: 60, DURATION_64: 16})])] * 2, tempo=250000
+        )
+        tracks = load_midi(filename)
+        # kept from parsing the file rather than read again
+        self.assertTrue(tracks._tempo_map is not None)
+        self.assertEqual(tracks.tempo_map.offsets_to_seconds(32), 0.5)
+        selected = load_midi(filename, tracks=[2])
+        self.assertEqual(len(selected), 1)
+        self.assertEqual(selected.tempo_map.offsets_to_seconds(32), 0.5)
+
+
+class TestEventTable(TempMidiFiles, TestCase):
+
+    def test_load_event_table(self):
+        from sebastian.midi.table import load_event_table
+        data = (
+            b"MThd\x00\x00\x00\x06\x00\x00\x00\x01\x01\xE0"
+            b"MTrk\x00\x00\x00\x1B"
+            b"\x00\xC1\x05"  # program change on channel 2
+            b"\x07\x91\x3C\x40"
+            b"\x00\x90\x3C\x50"  # same pitch, another channel
+            b"\x10\xB1\x07\x64"  # controller
+            b"\x71\x81\x3C\x00"
+            b"\x00\x80\x3C\x00"
+            b"\x00\xFF\x2F\x00"
+        )
+        table = load_event_table(self.write_temp_midi(data))
+        self.assertEqual((table.format, table.num_tracks, table.division), (0, 1, 480))
+        self.assertEqual(list(table.notes.rows()), [
+            (0, 7, 129, 2, 60, 64),
+            (0, 7, 129, 1, 60, 80),
+        ])
+        self.assertEqual(list(table.events.rows()), [
+            (0, 0, 0xC1, 5, -1),
+            (0, 23, 0xB1, 7, 100),
+            (0, 136, 0xFF, 0x2F, -1),
+        ])
+        self.assertEqual(table.meta_data, {2: b""})
+        self.assertEqual(list(table.notes.column("velocity")), [64, 80])
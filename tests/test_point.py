@@ -111,3 +111,54 @@ class TestPoint(TestCase):
         self.assertEqual(DURATION_64, DURATION_64)
         self.assertEqual(MIDI_PITCH, MIDI_PITCH)
         self.assertEqual(DEGREE, "degree")
+
+    def test_compact_point_behaves_like_point(self):
+        """
+        Ensure CompactPoint compares, unifies and tuples like a Point
+        """
+        from sebastian.core import CompactPoint, Point
+        from sebastian.core import OFFSET_64, DURATION_64, MIDI_PITCH
+        p1 = self.make_point()
+        c1 = CompactPoint(p1)
+        self.assertEqual(c1, p1)
+        self.assertEqual(p1, c1)
+        self.assertEqual(Point(c1), p1)
+        self.assertEqual(c1.tuple(OFFSET_64, DURATION_64), (16, 17))
+        self.assertEqual(c1 % CompactPoint(velocity=10), Point(p1, velocity=10))
+        self.assertEqual(p1 % CompactPoint(velocity=10), Point(p1, velocity=10))
+        c1["velocity"] = 10
+        del c1[MIDI_PITCH]
+        self.assertEqual(sorted(c1), sorted([OFFSET_64, DURATION_64, "velocity"]))
+        self.assertRaises(KeyError, lambda: c1[MIDI_PITCH])
+
+    def test_compact_point_unification_error(self):
+        """
+        Ensure CompactPoint.unify raises on conflicting attributes
+        """
+        from sebastian.core import CompactPoint
+        from sebastian.core.elements import UnificationError
+        c1 = CompactPoint(self.make_point())
+        c2 = CompactPoint(self.make_point(), midi_pitch=3)
+        self.assertRaises(UnificationError, lambda: c1 % c2)
+
+    def test_compact_point_pickles(self):
+        """
+        Ensure a CompactPoint survives pickling with any protocol
+        """
+        import pickle
+        from sebastian.core import CompactPoint
+        c1 = CompactPoint(self.make_point(), lyric="la")
+        for protocol in range(pickle.HIGHEST_PROTOCOL + 1):
+            c2 = pickle.loads(pickle.dumps(c1, protocol))
+            self.assertEqual(c2, c1)
+            self.assertEqual(c2.__class__, CompactPoint)
+
+    def test_compact_sequence(self):
+        """
+        Ensure a sequence can keep its points as CompactPoints
+        """
+        from sebastian.core import CompactOSequence, CompactPoint, OSequence, Point
+        points = [self.make_point(), Point(duration_64=4, lyric="la")]
+        s1 = CompactOSequence(points)
+        self.assertTrue(all(isinstance(point, CompactPoint) for point in s1._elements))
+        self.assertEqual(list(s1 * 2), list(OSequence(points) * 2))
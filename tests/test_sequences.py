@@ -406,3 +406,280 @@ class TestSequences(TestCase):
             {MIDI_PITCH: 51, DURATION_64: 10},
             {MIDI_PITCH: 52, DURATION_64: 10},
         ]))
+
+    def test_columnar_sequence_matches_list_sequence(self):
+        """
+        Ensure a columnar sequence holds the same points as a list one
+        """
+        from sebastian.core import OSequence, ColumnarOSequence, Point
+        points = [
+            self.make_point(),
+            Point(self.make_point(3), dynamic="p"),
+            Point(duration_64=4),
+        ]
+        s1 = OSequence(points)
+        s2 = ColumnarOSequence(points)
+        self.assertEqual(list(s1), list(s2))
+        self.assertEqual(s1[-1], s2[-1])
+        self.assertEqual(s1.next_offset(), s2.next_offset())
+
+    def test_columnar_sequence_underspecified_points(self):
+        """
+        Ensure attributes missing from some points stay missing
+        """
+        from sebastian.core import ColumnarOSequence, Point
+        from sebastian.core import OFFSET_64, MIDI_PITCH
+        s1 = ColumnarOSequence(Point(offset_64=0), Point(offset_64=4, midi_pitch=60, lyric="la"))
+        self.assertEqual(list(s1), [
+            {OFFSET_64: 0},
+            {OFFSET_64: 4, MIDI_PITCH: 60, "lyric": "la"},
+        ])
+        self.assertTrue(isinstance(s1[0], Point))
+
+    def test_columnar_sequence_point_changes(self):
+        """
+        Ensure changes to a point taken by index are kept, as in a list
+        """
+        from sebastian.core import ColumnarOSequence, Point
+        from sebastian.core import OFFSET_64, MIDI_PITCH
+        s1 = ColumnarOSequence(Point(offset_64=0, midi_pitch=60), Point(offset_64=4))
+        s1[0][MIDI_PITCH] = 62
+        s1[1]["lyric"] = "la"
+        s1[1][MIDI_PITCH] = 64
+        s1[1]["lyric"] = 3
+        del s1[0][MIDI_PITCH]
+        s1[0].update(dynamic="p")
+        self.assertEqual(list(s1), [
+            {OFFSET_64: 0, "dynamic": "p"},
+            {OFFSET_64: 4, MIDI_PITCH: 64, "lyric": 3},
+        ])
+        self.assertEqual(s1[1], {OFFSET_64: 4, MIDI_PITCH: 64, "lyric": 3})
+
+    def test_columnar_sequence_operators(self):
+        """
+        Ensure columnar sequences support the usual sequence operators
+        """
+        from sebastian.core import OSequence, ColumnarOSequence
+        from sebastian.core.transforms import transpose
+        points = [self.make_point(), self.make_point(3)]
+        s1 = OSequence(points)
+        s2 = ColumnarOSequence(points)
+        self.assertEqual(list(s1 + s1), list(s2 + s2))
+        self.assertEqual(list(s1 * 3), list(s2 * 3))
+        self.assertEqual(list(s1 // s1), list(s2 // s2))
+        self.assertEqual(list(s1 | transpose(2)), list(s2 | transpose(2)))
+        self.assertEqual(type(s2 * 3), ColumnarOSequence)
+
+    def test_sequence_tracks_last_point_on_append(self):
+        """
+        Ensure last_point and next_offset follow appends in any order
+        """
+        from sebastian.core import OSequence
+        from sebastian.core import OFFSET_64, DURATION_64
+        s1 = OSequence()
+        s1.append({OFFSET_64: 10, DURATION_64: 4})
+        self.assertTrue(s1.is_sorted())
+        s1.append({OFFSET_64: 2, DURATION_64: 40})
+        self.assertFalse(s1.is_sorted())
+        self.assertEqual(s1.next_offset(), 14)
+        s1.append({OFFSET_64: 10, DURATION_64: 6})
+        self.assertEqual(s1.last_point(), {OFFSET_64: 10, DURATION_64: 6})
+        self.assertEqual((s1 * 2).next_offset(), 32)
+
+    def test_sequence_tracks_points_changed_by_index(self):
+        """
+        Ensure last_point, next_offset and is_sorted see offsets changed in
+        place on points taken by index
+        """
+        from sebastian.core import OSequence
+        from sebastian.core import OFFSET_64, DURATION_64
+        s1 = OSequence({OFFSET_64: 0, DURATION_64: 4}, {OFFSET_64: 4, DURATION_64: 4})
+        self.assertTrue(s1.is_sorted())
+        s1[0][OFFSET_64] = 20
+        self.assertFalse(s1.is_sorted())
+        self.assertEqual(s1.last_point(), {OFFSET_64: 20, DURATION_64: 4})
+        self.assertEqual(s1.next_offset(), 24)
+
+    def test_sequence_repeat_shares_points(self):
+        """
+        Ensure repeating a sequence copies its points only once
+        """
+        from sebastian.core import OSequence
+        from sebastian.core.storage import Rope
+        s1 = self.make_sequence()
+        repeat = s1 * 1000
+        self.assertTrue(isinstance(repeat._elements, Rope))
+        self.assertEqual(len(repeat._elements._parts), 1000)
+        self.assertEqual(len(repeat), 2000)
+        self.assertEqual(repeat.next_offset(), 1000 * s1.next_offset())
+        self.assertEqual(list(repeat), list(OSequence(list(s1 * 2)) * 500))
+
+    def test_sequence_repeat_of_repeat_is_a_tree(self):
+        """
+        Ensure repeating a repetition, or concatenating onto a sequence over
+        and over, doesn't copy the parts of the ropes involved
+        """
+        from sebastian.core import OSequence, Point
+        from sebastian.core import OFFSET_64, DURATION_64
+        s1 = self.make_sequence()
+        repeat = (s1 * 100) * 100
+        self.assertEqual(len(repeat._elements._parts), 100)
+        self.assertEqual(len(repeat), 20000)
+        self.assertEqual(repeat[-1], list(s1 * 10000)[-1])
+        self.assertEqual(list(repeat), list(OSequence(list(s1 * 100)) * 100))
+
+        s2 = OSequence()
+        for n in range(2000):
+            s2 = s2 + OSequence(Point({OFFSET_64: 0, DURATION_64: 1}))
+        self.assertTrue(len(s2._elements._parts) < 100)
+        self.assertEqual([point[OFFSET_64] for point in s2], list(range(2000)))
+        self.assertEqual(s2[1234], {OFFSET_64: 1234, DURATION_64: 1})
+
+    def test_sequence_concat_materializes_on_change(self):
+        """
+        Ensure changing a lazily concatenated sequence leaves its parts alone
+        """
+        from sebastian.core import OFFSET_64, DURATION_64
+        s1 = self.make_sequence()
+        s2 = s1 + s1
+        s2.append({DURATION_64: 1})
+        s2[0]["velocity"] = 10
+        self.assertEqual(list(s2)[-1], {OFFSET_64: 78, DURATION_64: 1})
+        self.assertEqual(s2[0]["velocity"], 10)
+        self.assertTrue("velocity" not in s1[0])
+        self.assertEqual(len(s1), 2)
+
+    def test_sequence_concat_keeps_changes_made_while_iterating(self):
+        """
+        Ensure points of a lazily joined sequence can be changed while
+        iterating over it, as those of any other sequence can
+        """
+        from sebastian.core.storage import Rope
+        s1 = self.make_sequence()
+        for s2 in s1 + s1, s1 * 2:
+            self.assertTrue(isinstance(s2._elements, Rope))
+            self.assertEqual(s2[-1], list(s2)[-1])
+            self.assertTrue(isinstance(s2._elements, Rope))
+            for point in s2:
+                point["velocity"] = 10
+            self.assertFalse(isinstance(s2._elements, Rope))
+            self.assertEqual([point["velocity"] for point in s2], [10] * 4)
+        self.assertTrue("velocity" not in s1[0])
+
+    def test_sequence_concat_and_repeat_ignore_later_changes(self):
+        """
+        Ensure changing a sequence in place doesn't change ones made from it
+        """
+        from sebastian.core import OSequence
+        s1 = self.make_sequence()
+        s2 = s1 + OSequence(s1)
+        s3 = s1 * 2
+        expected = list(s3)
+        s1[0]["pitch"] = 100
+        self.assertEqual(list(s3), expected)
+        self.assertEqual(list(s2), expected)
+
+    def test_oseq_subseq_after_change_by_index(self):
+        """
+        Ensure subseq sees an offset changed on a point taken by index
+        """
+        from sebastian.core import OSeq, Point
+        OffsetSequence = OSeq("offset", "duration")
+
+        s1 = OffsetSequence(Point(a=1, offset=0), Point(a=2, offset=10))
+        self.assertEqual(list(s1.subseq(40)), [])
+        s1[1]["offset"] = 50
+        self.assertEqual(list(s1.subseq(40)), [Point(a=2, offset=50)])
+
+    def test_oseq_sounding_at(self):
+        """
+        Ensure sounding_at finds only the points sounding at that offset
+        """
+        from sebastian.core import OSeq, Point
+        OffsetSequence = OSeq("offset", "duration")
+
+        s1 = OffsetSequence(
+            Point(a=1, offset=0, duration=100),
+            Point(a=2, offset=10, duration=10),
+            Point(a=3, offset=20, duration=5),
+            Point(a=4, offset=20),
+            Point(a=5, offset=30, duration=10),
+        )
+        self.assertEqual([p["a"] for p in s1.sounding_at(20)], [1, 3])
+        self.assertEqual([p["a"] for p in s1.sounding_at(25)], [1])
+        self.assertEqual([p["a"] for p in s1.sounding_at(100)], [])
+
+    def test_oseq_overlapping(self):
+        """
+        Ensure overlapping finds points sounding at any time in a range
+        """
+        from sebastian.core import OSeq, Point
+        OffsetSequence = OSeq("offset", "duration")
+
+        s1 = OffsetSequence(
+            Point(a=1, offset=0, duration=5),
+            Point(a=2, offset=10, duration=10),
+            Point(a=3, offset=20),
+            Point(a=4, offset=30, duration=10),
+        )
+        self.assertEqual([p["a"] for p in s1.overlapping(15, 30)], [2, 3])
+        self.assertEqual([p["a"] for p in s1.overlapping(5, 10)], [])
+
+    def test_oseq_time_index_rebuilt_on_append(self):
+        """
+        Ensure range queries see points appended after an earlier query
+        """
+        from sebastian.core import OSeq, Point
+        OffsetSequence = OSeq("offset", "duration")
+
+        s1 = OffsetSequence(Point(a=1, offset=0, duration=10))
+        self.assertEqual(len(s1.subseq(5, 20)), 0)
+        s1.append(Point(a=2, duration=10))
+        self.assertEqual(list(s1.subseq(5, 20)), [Point(a=2, offset=10, duration=10)])
+        self.assertEqual(len(s1.sounding_at(15)), 1)
+
+    def test_merge_all(self):
+        """
+        Ensure many sequences merge into offset order in one go
+        """
+        from sebastian.core import OSequence, merge_all, iter_merged
+        from sebastian.core import OFFSET_64
+        seqs = [self.make_sequence(offset=n) for n in range(5)]
+        seqs.append(OSequence([self.make_point(40), self.make_point(-10)]))
+        merged = merge_all(*seqs)
+        expected = sorted(sum([list(seq) for seq in seqs], []), key=lambda x: x[OFFSET_64])
+        self.assertEqual(list(merged), expected)
+        self.assertEqual(list(iter_merged(*seqs)), expected)
+        self.assertTrue(merged.is_sorted())
+        self.assertEqual(merge_all(seqs[0], seqs[1]), seqs[0] // seqs[1])
+
+    def test_sequence_zip_with_conflicts(self):
+        """
+        Ensure zipping reports every conflict rather than stopping
+        """
+        from sebastian.core import HSeq
+        from sebastian.core.elements import UnificationError
+        s1 = HSeq([{"a": 1, "b": 2}, {"a": 1}, {"a": 3, "b": 4}])
+        s2 = HSeq([{"a": 1, "c": 5}, {"a": 2}, {"a": 4, "b": 5}])
+        zipped, conflicts = s1.zip_with_conflicts(s2)
+        self.assertEqual(list(zipped), [{"a": 1, "b": 2, "c": 5}, {"a": 1}, {"a": 3, "b": 4}])
+        self.assertEqual(sorted(conflicts), [(1, "a"), (2, "a"), (2, "b")])
+        self.assertRaises(UnificationError, lambda: s1 & s2)
+
+    def test_columnar_sequence_zip_with_conflicts(self):
+        """
+        Ensure columnar sequences zip the same as list ones
+        """
+        from sebastian.core import OSequence, ColumnarOSequence
+        from sebastian.core import OFFSET_64, DURATION_64, MIDI_PITCH
+        rhythm = [{OFFSET_64: 4 * n, DURATION_64: 4} for n in range(20)]
+        pitches = [{OFFSET_64: 4 * n, MIDI_PITCH: 60 + n} for n in range(20)]
+        pitches[3][OFFSET_64] = 13
+        del pitches[5][MIDI_PITCH]
+        expected, expected_conflicts = OSequence(rhythm).zip_with_conflicts(OSequence(pitches))
+        zipped, conflicts = ColumnarOSequence(rhythm).zip_with_conflicts(ColumnarOSequence(pitches))
+        self.assertEqual(list(zipped), list(expected))
+        self.assertEqual(conflicts, expected_conflicts)
+        self.assertEqual(conflicts, [(3, OFFSET_64)])
+        zipped = ColumnarOSequence(rhythm[:1]) & [{MIDI_PITCH: 60}]
+        self.assertEqual(list(zipped), [{OFFSET_64: 0, DURATION_64: 4, MIDI_PITCH: 60}])
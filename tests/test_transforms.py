@@ -88,6 +88,22 @@ class TestTransforms(TestCase):
             {"pitch": 53, OFFSET_64: 38, DURATION_64: 40}
         ])
 
+    def test_rescale(self):
+        """
+        Ensure that rescale converts ticks to a new division
+        """
+        from sebastian.core.transforms import rescale
+        from sebastian.core import OSequence, Point, OFFSET_64, TICKS, DURATION_TICKS, DIVISION
+        s1 = OSequence([
+            Point({OFFSET_64: 0, TICKS: 7, DURATION_TICKS: 113, DIVISION: 480}),
+            Point({OFFSET_64: 1}),
+        ])
+        self.assertEqual((s1 | rescale(960))._elements, [
+            {OFFSET_64: 0, TICKS: 14, DURATION_TICKS: 226, DIVISION: 960},
+            {OFFSET_64: 1},
+        ])
+        self.assertEqual((s1 | rescale(96))._elements[0], {OFFSET_64: 0, TICKS: 1, DURATION_TICKS: 22, DIVISION: 96})
+
     def test_strech_is_reversable(self):
         """
         Ensure that stretch and contract is an identity operation
@@ -323,3 +339,129 @@ class TestTransforms(TestCase):
                 Point(a=2, offset=25)
             )
         )
+
+    def test_transform_ignores_later_changes(self):
+        """
+        Ensure changing a sequence after transforming it doesn't change the
+        lazily transformed result
+        """
+        from sebastian.core.transforms import transpose
+        s1 = self.make_sequence()
+        s2 = s1 | transpose(12)
+        s1[0]["pitch"] = 100
+        self.assertEqual([point["pitch"] for point in s2], [62, 65])
+
+    def test_fused_transforms_copy_points_once(self):
+        """
+        Ensure a run of transforms changes its own copies of the points in
+        place, unless a sequence earlier in the run is still to be worked out
+        """
+        from sebastian.core.transforms import transpose
+        s1 = self.make_sequence()
+        s2 = s1 | transpose(12) | transpose(1)
+        copies = s2._elements._source
+        self.assertEqual([point["pitch"] for point in s2], [63, 66])
+        self.assertTrue(all(a is b for a, b in zip(copies, s2)))
+
+        s3 = s1 | transpose(12)
+        s4 = s3 | transpose(1)
+        self.assertEqual([point["pitch"] for point in s4], [63, 66])
+        self.assertEqual([point["pitch"] for point in s3], [62, 65])
+
+    def test_transformed_vseq_merge(self):
+        """
+        Ensure a lazily transformed VSeq merges like any other
+        """
+        from sebastian.core import VSeq, Point
+        from sebastian.core.transforms import transpose
+        v1 = VSeq([Point(pitch=1), Point(pitch=2)])
+        merged = (v1 | transpose(2)) // VSeq([Point(pitch=5)])
+        self.assertEqual(list(merged), [{"pitch": 3}, {"pitch": 4}, {"pitch": 5}])
+
+    def test_transformed_points_not_shared(self):
+        """
+        Ensure changes to lazily transformed points don't reach sequences
+        made from them
+        """
+        from sebastian.core.transforms import transpose
+        s1 = self.make_sequence() | transpose(12)
+        s2 = s1 * 2
+        for point in s1:
+            point["pitch"] = 0
+        self.assertEqual([point["pitch"] for point in s2], [62, 65, 62, 65])
+
+    def test_transforms_fused_into_one_pass(self):
+        """
+        Ensure a run of point transforms is applied lazily in a single pass
+        """
+        from sebastian.core.transforms import transform_sequence, transpose
+        from sebastian.core.storage import Mapped
+        from sebastian.core import OFFSET_64, DURATION_64
+        calls = []
+
+        @transform_sequence
+        def record(name, point):
+            calls.append((name, point["pitch"]))
+            return point
+
+        s1 = self.make_sequence()
+        s2 = s1 | record("a") | transpose(12) | record("b")
+        self.assertEqual(calls, [])
+        self.assertTrue(isinstance(s2._elements, Mapped))
+        self.assertEqual(len(s2._elements._funcs), 3)
+        self.assertEqual(s2._elements, [
+            {"pitch": 62, OFFSET_64: 16, DURATION_64: 17},
+            {"pitch": 65, OFFSET_64: 19, DURATION_64: 20}
+        ])
+        self.assertEqual(calls, [("a", 50), ("b", 62), ("a", 53), ("b", 65)])
+        self.assertEqual(s2.next_offset(), 39)
+        self.assertEqual(s1[0]["pitch"], 50)
+
+    def test_vectorized_transforms_match_point_transforms(self):
+        """
+        Ensure numpy versions of transforms give the same points
+        """
+        from sebastian.core import transforms
+        if transforms.numpy is None:
+            # nothing to compare (skipTest isn't in Python 2.6)
+            return
+        from sebastian.core import OSequence, ColumnarOSequence, Point
+        from sebastian.core.storage import ColumnStore
+        from sebastian.core.transforms import transpose, stretch, invert, midi_pitch, midi_to_pitch, dynamics, rescale
+        from sebastian.core import OFFSET_64, DURATION_64, MIDI_PITCH
+
+        points = []
+        for n in range(300):
+            point = Point({OFFSET_64: n * 5 - 40, "pitch": n % 23 - 11, "octave": n % 7})
+            if n % 3:
+                point[DURATION_64] = n % 11
+            if n % 4:
+                point[MIDI_PITCH] = n % 97
+            points.append(point)
+
+        for transform in [
+            transpose(3), stretch(3), stretch(0.7), stretch(-1.5), invert(60),
+            midi_pitch(), midi_to_pitch(), dynamics("p", "ff"), dynamics("f", "pp"),
+        ]:
+            expected = OSequence(points) | transform
+            columnar = ColumnarOSequence(points) | transform
+            self.assertTrue(isinstance(columnar._elements, ColumnStore))
+            self.assertEqual(list(columnar), list(expected))
+
+        # rescaling points with ticks
+        tick_points = [
+            Point({OFFSET_64: n, "ticks": n * 7, "duration_ticks": n % 5, "division": 480})
+            for n in range(300)
+        ]
+        expected = OSequence(tick_points) | rescale(96)
+        columnar = ColumnarOSequence(tick_points) | rescale(96)
+        self.assertTrue(isinstance(columnar._elements, ColumnStore))
+        self.assertEqual(list(columnar), list(expected))
+
+        # points without a midi_pitch keep the pitch they had
+        del points[1][MIDI_PITCH]
+        del points[2]["pitch"]
+        self.assertEqual(
+            list(ColumnarOSequence(points) | midi_to_pitch()),
+            list(OSequence(points) | midi_to_pitch())
+        )
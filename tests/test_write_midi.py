@@ -1,7 +1,9 @@
 from unittest import TestCase
 
+from midi_files import TempMidiFiles
 
-class TestWriteMidi(TestCase):
+
+class TestWriteMidi(TempMidiFiles, TestCase):
 
     def test_write_midi(self):
         """
@@ -119,3 +121,208 @@ class TestWriteMidi(TestCase):
         actual_bytes = out_fd.getvalue()
 
         self.assertEqual(expected_bytes, actual_bytes)
+
+    def test_note_events_match_start_and_end_note(self):
+        from sebastian.midi.write_midi import Trk
+        events = [
+            (True, 0, 60, 64), (True, 0, 64, 300), (False, 100, 60, 64),
+            (True, 20000, 67, -5), (False, 2500000, 64, 300), (False, 2500000, 67, -5),
+        ]
+        t1 = Trk()
+        prev_offset = None
+        for on, offset, note_number, velocity in events:
+            time_delta = 0 if prev_offset is None else offset - prev_offset
+            if on:
+                t1.start_note(time_delta, 2, note_number, velocity)
+            else:
+                t1.end_note(time_delta, 2, note_number)
+            prev_offset = offset
+        t2 = Trk()
+        t2.note_events(2, events)
+        self.assertEqual(t1.data.getvalue(), t2.data.getvalue())
+        self.assertEqual(t2.data.getvalue()[:8], b'\x00\x92\x3c\x40\x00\x92\x40\xff')
+
+    def test_varlen(self):
+        from sebastian.midi.write_midi import varlen
+        self.assertEqual(varlen(0), b'\x00')
+        self.assertEqual(varlen(0x7F), b'\x7f')
+        self.assertEqual(varlen(0x80), b'\x81\x00')
+        self.assertEqual(varlen(0x3FFF), b'\xff\x7f')
+        self.assertEqual(varlen(0x4000), b'\x81\x80\x00')
+        self.assertEqual(varlen(0x0FFFFFFF), b'\xff\xff\xff\x7f')
+        self.assertRaises(ValueError, varlen, -1)
+        self.assertRaises(ValueError, varlen, -0x4000)
+
+    def test_smf_writer(self):
+        """
+        Ensure the streaming writer writes the same file as SMF from the
+        same events
+        """
+        from sebastian.core import OSequence, Point
+        from sebastian.core import OFFSET_64, MIDI_PITCH, DURATION_64
+        from sebastian.midi.write_midi import SMF, SMFWriter
+        from sebastian.midi.midi import iter_chunks, iter_track_events
+        from io import BytesIO
+
+        test = OSequence([
+            Point({OFFSET_64: o, MIDI_PITCH: m, DURATION_64: d}) for (o, m, d) in [
+                (0, 60, 16), (16, 72, 16), (32, 64, 200), (48, 55, 20000)
+            ]
+        ])
+        out = BytesIO()
+        SMF([test, test]).write(out, title="streamed")
+        expected = out.getvalue()
+
+        data = bytearray(expected)
+        tracks = [
+            iter_track_events(data, start, end)
+            for chunk_id, start, end in iter_chunks(data) if chunk_id == b"MTrk"
+        ]
+        streamed = BytesIO()
+        streamed.write(b"junk")
+        with SMFWriter(streamed) as writer:
+            writer.buffer_size = 8
+            for events in tracks:
+                writer.write_track(events)
+        self.assertEqual(streamed.getvalue(), b"junk" + expected)
+
+    def test_smf_writer_adds_track_end(self):
+        from sebastian.midi.write_midi import SMFWriter
+        from io import BytesIO
+        out = BytesIO()
+        with SMFWriter(out, format=0, division=96) as writer:
+            writer.write_track([(0, 0xC0, 5, None), (0, 0x90, 60, 64), (200, 0x80, 60, 0)])
+        self.assertEqual(
+            out.getvalue(),
+            b"MThd\x00\x00\x00\x06\x00\x00\x00\x01\x00\x60"
+            b"MTrk\x00\x00\x00\x10\x00\xC0\x05\x00\x90\x3C\x40\x81\x48\x80\x3C\x00\x00\xFF\x2F\x00"
+        )
+        self.assertRaises(ValueError, writer.write_track, [(10, 0x90, 60, 64), (5, 0x80, 60, 0)])
+
+    def test_iter_note_events(self):
+        """
+        Ensure merging the note offs of sorted points gives the events in
+        the same order as sorting them all
+        """
+        import random
+        from sebastian.core import OSequence, Point
+        from sebastian.core import OFFSET_64, MIDI_PITCH, DURATION_64
+        from sebastian.midi.write_midi import iter_note_events
+
+        def sorted_events(points):
+            events = []
+            for point in points:
+                if MIDI_PITCH in point:
+                    velocity = point.get("velocity", 64)
+                    events.append((True, point[OFFSET_64], point[MIDI_PITCH], velocity))
+                    events.append((False, point[OFFSET_64] + point[DURATION_64], point[MIDI_PITCH], velocity))
+            return sorted(events, key=lambda x: x[1])
+
+        random.seed(23)
+        offset = 0
+        points = []
+        for n in range(500):
+            offset += random.choice([0, 0, 1, 4, 16])
+            point = Point({OFFSET_64: offset, DURATION_64: random.choice([0, 1, 4, 16, 64])})
+            if n % 7:
+                point[MIDI_PITCH] = random.randint(30, 90)
+            if n % 3 == 0:
+                point["velocity"] = n % 128
+            points.append(point)
+        seq = OSequence(points)
+        self.assertTrue(seq.is_sorted())
+        merged = iter_note_events(seq)
+        self.assertFalse(isinstance(merged, list))
+        self.assertEqual(list(merged), sorted_events(points))
+
+        random.shuffle(points)
+        seq = OSequence(points)
+        self.assertFalse(seq.is_sorted())
+        self.assertEqual(list(iter_note_events(seq)), sorted_events(points))
+
+    def test_points_changed_in_place(self):
+        """
+        Ensure points moved out of order after they were appended are still
+        written in offset order
+        """
+        from sebastian.core import OSequence, Point
+        from sebastian.core import OFFSET_64, MIDI_PITCH, DURATION_64
+        from sebastian.midi.write_midi import SMF
+        from io import BytesIO
+
+        def written(seq):
+            out = BytesIO()
+            SMF([seq]).write(out)
+            return out.getvalue()
+
+        def make_sequence():
+            return OSequence([
+                Point({OFFSET_64: 0, MIDI_PITCH: 60, DURATION_64: 4}),
+                Point({OFFSET_64: 4, MIDI_PITCH: 62, DURATION_64: 4}),
+            ])
+
+        expected = written(OSequence([
+            Point({OFFSET_64: 0, MIDI_PITCH: 62, DURATION_64: 4}),
+            Point({OFFSET_64: 20, MIDI_PITCH: 60, DURATION_64: 4}),
+        ]))
+        s1 = make_sequence()
+        s1[0][OFFSET_64] = 20
+        s1[1][OFFSET_64] = 0
+        self.assertEqual(written(s1), expected)
+        s2 = make_sequence()
+        for point in s2:
+            point[OFFSET_64] = 20 - 5 * point[OFFSET_64]
+        self.assertTrue(s2.is_sorted())
+        self.assertEqual(written(s2), expected)
+
+    def test_compact(self):
+        """
+        Ensure compact files are smaller and load back to the same points
+        """
+        from sebastian.core import OSequence, Point
+        from sebastian.core import OFFSET_64, MIDI_PITCH, DURATION_64
+        from sebastian.midi.write_midi import SMF
+        from sebastian.midi.midi import load_midi
+        from io import BytesIO
+
+        tracks = [
+            OSequence([
+                Point({OFFSET_64: 4 * n, MIDI_PITCH: 40 + (n * 5 + t) % 40, DURATION_64: 2 + n % 3})
+                for n in range(100)
+            ])
+            for t in range(3)
+        ]
+        out = BytesIO()
+        SMF(tracks).write(out)
+        compact_out = BytesIO()
+        SMF(tracks).write(compact_out, compact=True)
+        full, compact = out.getvalue(), compact_out.getvalue()
+        self.assertTrue(len(compact) < 0.8 * len(full))
+        self.assertTrue(b"\x00\x90\x28\x40\x02\x28\x00\x02\x2d\x40" in compact)
+
+        loaded = [
+            [list(track) for track in load_midi(self.write_temp_midi(data))]
+            for data in (full, compact)
+        ]
+        self.assertEqual(loaded[0], loaded[1])
+        self.assertEqual(loaded[1][1:], [list(track) for track in tracks])
+
+    def test_to_bytes_and_write(self):
+        from sebastian.core import OSequence, Point
+        from sebastian.core import OFFSET_64, MIDI_PITCH, DURATION_64
+        from sebastian.midi.write_midi import SMF, write
+        from io import BytesIO
+
+        test = OSequence([Point({OFFSET_64: 0, MIDI_PITCH: 60, DURATION_64: 16})])
+        out = BytesIO()
+        SMF([test]).write(out, title="bytes")
+        self.assertEqual(SMF([test]).to_bytes(title="bytes"), out.getvalue())
+
+        to_file = BytesIO()
+        write(to_file, [test], title="bytes")
+        self.assertEqual(to_file.getvalue(), out.getvalue())
+
+        filename = self.write_temp_midi(b"")
+        write(filename, [test], title="bytes")
+        with open(filename, "rb") as f:
+            self.assertEqual(f.read(), out.getvalue())